@@ -3,7 +3,166 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS preset for the backend in url; every value can be overridden.
+
+    Each gunicorn worker has its own pool, so the default pool holds one connection per
+    request thread plus one for background work. Pre-ping, LIFO checkout, a short pool
+    timeout and a connect timeout make a failover cost one failed ping per stale connection
+    instead of a pile-up of requests waiting on dead sockets.
+    """
+    url = url or ''
+    if url.startswith('sqlite'):
+        # sqlite has no server to lose; just wait out writers instead of failing with "locked"
+        return {'connect_args': {'timeout': float(os.getenv("DB_BUSY_TIMEOUT", 15))}}
+
+    threads = int(os.getenv("WEB_THREADS", 4))
+    connect_timeout = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+    options = {
+        'pool_size': int(os.getenv("DB_POOL_SIZE", threads + 1)),
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", threads)),
+        'pool_timeout': float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        'pool_use_lifo': True,
+    }
+    if url.startswith('postgresql'):
+        # the statement timeout is for requests; migrations/env.py lifts it for `flask db upgrade`
+        options['pool_recycle'] = int(os.getenv("DB_POOL_RECYCLE", 1800))
+        options['connect_args'] = {
+            'connect_timeout': connect_timeout,
+            'options': f'-c statement_timeout={int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15000))}',
+        }
+    elif url.startswith('mysql'):
+        # under MySQL's wait_timeout and the idle cut-off of most proxies; the statement
+        # timeout is set per connection by pkg.dbpool since drivers differ
+        options['pool_recycle'] = int(os.getenv("DB_POOL_RECYCLE", 280))
+        timeout_arg = 'connection_timeout' if 'mysqlconnector' in url.split('://')[0] else 'connect_timeout'
+        options['connect_args'] = {timeout_arg: connect_timeout}
+    return options
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries replica_0, replica_1, ... for comma separated replica URLs."""
+    urls = [u.strip() for u in urls.split(',') if u.strip()]
+    return {f'replica_{i}': {'url': url, **engine_options(url)} for i, url in enumerate(urls)}
+
+
 class Appconfig(object):
     SQLALCHEMY_DATABASE_URI=os.getenv("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS=False
-    SECRET_KEY = os.getenv("SECRET_KEY", 'fallback_secret_key')
\ No newline at end of file
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15000))
+
+    # read replicas (comma separated URLs) for SELECTs in GET requests; see pkg/replicas.py.
+    # A replica more than REPLICA_MAX_LAG seconds behind is skipped, and a user who just wrote
+    # reads the primary for REPLICA_STICKY_SECONDS.
+    SQLALCHEMY_BINDS = replica_binds(os.getenv("DATABASE_REPLICA_URLS", ""))
+    REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 5))
+
+    # per-request query profiler: 'off', 'on' or 'sampled' (a fraction of requests)
+    QUERY_PROFILER = os.getenv("QUERY_PROFILER", "off")
+    QUERY_PROFILER_SAMPLE_RATE = float(os.getenv("QUERY_PROFILER_SAMPLE_RATE", 0.01))
+    QUERY_PROFILER_N1_THRESHOLD = int(os.getenv("QUERY_PROFILER_N1_THRESHOLD", 5))
+    QUERY_PROFILER_SLOW_MS = float(os.getenv("QUERY_PROFILER_SLOW_MS", 500))
+    QUERY_PROFILER_HEADERS = os.getenv("QUERY_PROFILER_HEADERS", "1") == "1"
+
+    # /metrics (Prometheus text format). With several worker processes set METRICS_DIR to a
+    # directory they share (gunicorn.conf.py does); METRICS_TOKEN, if set, is required as a Bearer token
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_DIR = os.getenv("METRICS_DIR")
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    SECRET_KEY = os.getenv("SECRET_KEY", 'fallback_secret_key')
+
+    # number of products shown per storefront page (keyset paginated)
+    CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", 24))
+    # how long each process reuses its copy of the category list (admin dropdowns, search)
+    CATEGORY_CACHE_SECONDS = float(os.getenv("CATEGORY_CACHE_SECONDS", 300))
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+
+    # product search: 'auto' uses the tsvector/pg_trgm indexes on PostgreSQL and an in-process
+    # inverted index elsewhere ('postgres' or 'memory' force one); the in-process index picks up
+    # other workers' product changes every SEARCH_REFRESH_INTERVAL seconds
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+    SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 48))
+    SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", 5))
+
+    # rendered product fragment cache: 'memory' (per process LRU), 'sqlite' (shared per host) or 'none';
+    # either way the per-product versions that invalidate cards live in CATALOG_CACHE_PATH
+    # (default instance/catalog_cache.db), so every worker on a host drops a changed card at once
+    CATALOG_CACHE_BACKEND = os.getenv("CATALOG_CACHE_BACKEND", "memory")
+    CATALOG_CACHE_PATH = os.getenv("CATALOG_CACHE_PATH")
+    CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 300))
+    CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", 2048))
+
+    # storefront reads from a memory-mapped catalog file shared by every worker on the host
+    # (default instance/catalog.snapshot), rebuilt in the background CATALOG_SNAPSHOT_DEBOUNCE
+    # seconds after a product or stock change
+    CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "0") == "1"
+    CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH")
+    CATALOG_SNAPSHOT_DEBOUNCE = float(os.getenv("CATALOG_SNAPSHOT_DEBOUNCE", 1))
+
+    # fingerprinted CSS/JS written by `flask build-assets` (default pkg/static/dist);
+    # ASSETS_DEBUG=1 links the unminified sources in pkg/assets instead, for editing them
+    ASSETS_DIST = os.getenv("ASSETS_DIST")
+    ASSETS_DEBUG = os.getenv("ASSETS_DEBUG", "0") == "1"
+
+    # Paystack gateway; point PAYSTACK_BASE_URL at scripts/fake_paystack.py for local tests
+    PAYSTACK_BASE_URL = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")
+    PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY", "sk_test_9abd3f0268eb764945c16e6ee5a09b91a259524a")
+    PAYSTACK_CALLBACK_URL = os.getenv("PAYSTACK_CALLBACK_URL", "http://127.0.0.1:5000/paystack/update")
+    PAYSTACK_CONNECT_TIMEOUT = float(os.getenv("PAYSTACK_CONNECT_TIMEOUT", 3.05))
+    PAYSTACK_READ_TIMEOUT = float(os.getenv("PAYSTACK_READ_TIMEOUT", 10))
+    PAYSTACK_MAX_RETRIES = int(os.getenv("PAYSTACK_MAX_RETRIES", 2))
+    PAYSTACK_RETRY_BACKOFF = float(os.getenv("PAYSTACK_RETRY_BACKOFF", 0.25))
+    PAYSTACK_POOL_SIZE = int(os.getenv("PAYSTACK_POOL_SIZE", 10))
+
+    # outgoing mail (Flask-Mail). Mail is only ever sent by the outbox sender (flask send-mail,
+    # or in the web process with MAIL_OUTBOX_INPROCESS); scripts/debug_smtp.py on port 1025
+    # stands in for a real server locally
+    MAIL_SERVER = os.getenv("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.getenv("MAIL_PORT", 25))
+    MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "0") == "1"
+    MAIL_USE_SSL = os.getenv("MAIL_USE_SSL", "0") == "1"
+    MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+    MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", "iFARM <no-reply@ifarm.local>")
+    MAIL_OUTBOX_INPROCESS = os.getenv("MAIL_OUTBOX_INPROCESS", "0") == "1"
+    MAIL_OUTBOX_BATCH = int(os.getenv("MAIL_OUTBOX_BATCH", 50))
+    MAIL_OUTBOX_POLL = float(os.getenv("MAIL_OUTBOX_POLL", 2))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", 6))
+    MAIL_OUTBOX_BACKOFF = float(os.getenv("MAIL_OUTBOX_BACKOFF", 30))  # first retry delay, doubled each time
+
+    # payment reconciliation worker (flask reconcile-payments)
+    PAYMENT_WORKER_INPROCESS = os.getenv("PAYMENT_WORKER_INPROCESS", "0") == "1"
+    # set by gunicorn.conf.py: the app is preloaded in the master, so the *_INPROCESS workers
+    # are started in each forked worker instead (claiming jobs skips rows another one holds)
+    BACKGROUND_WORKERS_AFTER_FORK = os.getenv("BACKGROUND_WORKERS_AFTER_FORK", "0") == "1"
+    PAYMENT_WORKER_BATCH = int(os.getenv("PAYMENT_WORKER_BATCH", 200))
+    PAYMENT_WORKER_POLL = float(os.getenv("PAYMENT_WORKER_POLL", 2))
+    PAYMENT_VERIFY_THREADS = int(os.getenv("PAYMENT_VERIFY_THREADS", 8))
+    PAYMENT_JOB_MAX_ATTEMPTS = int(os.getenv("PAYMENT_JOB_MAX_ATTEMPTS", 5))
+    PAYMENT_SWEEP_AFTER = int(os.getenv("PAYMENT_SWEEP_AFTER", 1800))
+    PAYMENT_SWEEP_INTERVAL = int(os.getenv("PAYMENT_SWEEP_INTERVAL", 300))
+    # stock taken at checkout is given back if the payment has not settled by then; keep it
+    # above PAYMENT_SWEEP_AFTER so a pending payment is verified before its stock goes
+    STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 3600))
+
+    # password hashing: werkzeug method string (e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'),
+    # process pool size (0 hashes on the request thread) and how many calls may wait for it
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+    # product image variants: max width per variant, output formats, and the process pool size
+    # (0 builds variants on the request thread)
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+    IMAGE_VARIANT_SIZES = {'thumb': 160, 'card': 480, 'full': 1600}
+    IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 82))
+    # unreferenced files younger than this (seconds) survive `flask gc-images`
+    IMAGE_GC_GRACE = int(os.getenv("IMAGE_GC_GRACE", 3600))
@@ -0,0 +1,63 @@
+# Gunicorn settings for production. Every value can be tuned from the environment, e.g.
+#   WEB_CONCURRENCY=4 WEB_THREADS=8 gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing, os, tempfile
+
+# workers write their metrics here so /metrics can add them up; set before the app is loaded
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ifarm-metrics"))
+# the preloaded app must not start the in-process payment/mail workers in the master
+os.environ["BACKGROUND_WORKERS_AFTER_FORK"] = "1"
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('APP_PORT', 5000)}")
+
+# gthread workers: requests mostly wait on the database or Paystack, so a few threads per
+# process go further than extra processes. Hashing and image work have their own pools.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("WEB_THREADS", 4))
+
+# import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# recycle workers now and then so slow leaks never add up; the jitter stops them all
+# restarting at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    from pkg.metrics import clear_directory
+
+    clear_directory(os.environ["METRICS_DIR"])
+
+
+def post_fork(server, worker):
+    from pkg import app, start_background_workers
+    from pkg.models import db
+
+    # connections opened in the master while preloading (primary and replicas) must not be
+    # shared with the worker
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    start_background_workers(app)
+
+
+def worker_exit(server, worker):
+    from pkg import paystack, hasher, image_pipeline, metrics, reconciler, mail_sender
+
+    reconciler.stop(timeout=graceful_timeout)
+    mail_sender.stop(timeout=graceful_timeout)
+    if metrics.directory:
+        # fold this worker's totals into exited.json so its file does not outlive it
+        metrics.retire()
+    # let queued variant builds finish, then drop this worker's pools and sockets
+    image_pipeline.close(wait=True)
+    hasher.close(wait=False)
+    paystack.close()
@@ -1,4 +1,5 @@
 import logging
+from contextlib import contextmanager
 from logging.config import fileConfig
 
 from flask import current_app
@@ -51,6 +52,33 @@ def get_metadata():
     return target_db.metadata
 
 
+@contextmanager
+def without_statement_timeout(connection):
+    """Lift the web requests' DB_STATEMENT_TIMEOUT_MS for a migration run.
+
+    Migrations rebuild tables and indexes and may take far longer than any request; the
+    session goes back to the configured timeout before it returns to the pool.
+    """
+    dialect = connection.dialect.name
+    setting = {'postgresql': 'statement_timeout',
+               'mysql': 'SESSION max_execution_time'}.get(dialect)
+    if setting is None:
+        yield
+        return
+    # committed straight away: alembic must not find a transaction already open, and a SET
+    # in a rolled back transaction is undone
+    connection.exec_driver_sql(f'SET {setting} = 0')
+    connection.commit()
+    try:
+        yield
+    finally:
+        if connection.in_transaction():
+            connection.rollback()
+        timeout = int(current_app.config.get('DB_STATEMENT_TIMEOUT_MS') or 0)
+        connection.exec_driver_sql(f'SET {setting} = {timeout}')
+        connection.commit()
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -96,7 +124,7 @@ def run_migrations_online():
 
     connectable = get_engine()
 
-    with connectable.connect() as connection:
+    with connectable.connect() as connection, without_statement_timeout(connection):
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
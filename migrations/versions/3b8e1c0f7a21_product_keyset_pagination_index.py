@@ -0,0 +1,35 @@
+"""product keyset pagination index
+
+Revision ID: 3b8e1c0f7a21
+Revises: fc7c9d515f04
+Create Date: 2026-10-18 09:12:31.402115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e1c0f7a21'
+down_revision = 'fc7c9d515f04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the keyset cursor needs a value on every row
+    op.execute("UPDATE product SET dateadded = CURRENT_TIMESTAMP WHERE dateadded IS NULL")
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_dateadded_prod_id', ['dateadded', 'prod_id'], unique=False)
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_images_product_id'), ['product_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_images_product_id'))
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_dateadded_prod_id')
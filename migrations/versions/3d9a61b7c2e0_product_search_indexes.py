@@ -0,0 +1,41 @@
+"""product search: updated timestamp and text search indexes
+
+Revision ID: 3d9a61b7c2e0
+Revises: f10e880cb61f
+Create Date: 2026-10-18 15:40:12.204318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9a61b7c2e0'
+down_revision = 'f10e880cb61f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated', sa.DateTime(), nullable=True))
+    op.execute("UPDATE product SET updated = dateadded")
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_updated'), ['updated'], unique=False)
+
+    # the other databases use the in-process index (pkg/search.py)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_product_search ON product USING gin "
+                   "(to_tsvector('simple', prod_name || ' ' || coalesce(category, '')))")
+        op.execute("CREATE INDEX ix_product_name_trgm ON product USING gin (lower(prod_name) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_product_name_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_product_search")
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_updated'))
+        batch_op.drop_column('updated')
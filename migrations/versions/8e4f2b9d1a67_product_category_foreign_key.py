@@ -0,0 +1,75 @@
+"""link products to categories by foreign key, with per-category counts
+
+Revision ID: 8e4f2b9d1a67
+Revises: 3d9a61b7c2e0
+Create Date: 2026-10-18 16:52:31.770914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2b9d1a67'
+down_revision = '3d9a61b7c2e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        # rebuilt below on the name alone; search matches categories through cat_id
+        op.execute("DROP INDEX IF EXISTS ix_product_search")
+
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('product_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cat_id', sa.Integer(), nullable=True))
+
+    # products may name categories that were never created: create those first so no
+    # product loses its category, then link every product by name
+    op.execute("""
+        INSERT INTO category (cat_name)
+        SELECT DISTINCT trim(p.category) FROM product p
+        WHERE p.category IS NOT NULL AND trim(p.category) <> ''
+          AND NOT EXISTS (SELECT 1 FROM category c WHERE lower(trim(c.cat_name)) = lower(trim(p.category)))
+    """)
+    op.execute("""
+        UPDATE product SET cat_id = (
+            SELECT min(c.cat_id) FROM category c WHERE lower(trim(c.cat_name)) = lower(trim(product.category)))
+        WHERE category IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE category SET product_count = (
+            SELECT count(*) FROM product p WHERE p.cat_id = category.cat_id)
+    """)
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_product_cat_id_category', 'category', ['cat_id'], ['cat_id'])
+        batch_op.create_index('ix_product_cat_dateadded_prod_id', ['cat_id', 'dateadded', 'prod_id'], unique=False)
+        batch_op.drop_column('category')
+
+    if postgres:
+        op.execute("CREATE INDEX ix_product_search ON product USING gin (to_tsvector('simple', prod_name))")
+
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        op.execute("DROP INDEX IF EXISTS ix_product_search")
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('category', sa.String(length=100), nullable=True))
+    op.execute("UPDATE product SET category = (SELECT c.cat_name FROM category c WHERE c.cat_id = product.cat_id)")
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_cat_dateadded_prod_id')
+        batch_op.drop_constraint('fk_product_cat_id_category', type_='foreignkey')
+        batch_op.drop_column('cat_id')
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.drop_column('product_count')
+
+    if postgres:
+        op.execute("CREATE INDEX ix_product_search ON product USING gin "
+                   "(to_tsvector('simple', prod_name || ' ' || coalesce(category, '')))")
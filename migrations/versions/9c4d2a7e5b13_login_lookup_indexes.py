@@ -0,0 +1,81 @@
+"""login lookup indexes
+
+Revision ID: 9c4d2a7e5b13
+Revises: 407e25e3ba5f
+Create Date: 2026-10-18 11:02:47.118294
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4d2a7e5b13'
+down_revision = '407e25e3ba5f'
+branch_labels = None
+depends_on = None
+
+
+def _normalize_phone(phone):
+    # kept in step with pkg.accounts.normalize_phone, copied so the migration stays frozen
+    digits = re.sub(r'[\s\-().]', '', phone or '')
+    if digits.startswith('+234'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('234') and len(digits) == 13:
+        digits = '0' + digits[3:]
+    return digits
+
+
+def _normalize_phones(table, pk):
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(f"SELECT {pk}, phone FROM {table} WHERE phone IS NOT NULL")).fetchall()
+    changed = [{'pk': row[0], 'phone': _normalize_phone(row[1])}
+               for row in rows if _normalize_phone(row[1]) != row[1]]
+    if changed:
+        conn.execute(sa.text(f"UPDATE {table} SET phone = :phone WHERE {pk} = :pk"), changed)
+
+
+def _check_email_case_duplicates(table, pk):
+    # the unique lower(email) index cannot be built while two rows differ only in case;
+    # list them so they can be merged or corrected by hand, then re-run the upgrade
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        f"SELECT lower(email), {pk}, email FROM {table} WHERE lower(email) IN "
+        f"(SELECT lower(email) FROM {table} GROUP BY lower(email) HAVING count(*) > 1) "
+        f"ORDER BY lower(email), {pk}")).fetchall()
+    if rows:
+        clashes = {}
+        for key, row_id, email in rows:
+            clashes.setdefault(key, []).append(f'{pk}={row_id} ({email})')
+        report = '\n'.join(f'  {key}: ' + ', '.join(ids) for key, ids in clashes.items())
+        raise RuntimeError(f'{table} has {len(clashes)} email(s) registered more than once in different '
+                           f'case; resolve these before upgrading:\n{report}')
+
+
+def upgrade():
+    _check_email_case_duplicates('users', 'user_id')
+    _check_email_case_duplicates('admin', 'admin_id')
+    _normalize_phones('users', 'user_id')
+    _normalize_phones('admin', 'admin_id')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_email_lower', [sa.text('lower(email)')], unique=True)
+        batch_op.create_index('ix_users_phone', ['phone'], unique=False)
+
+    with op.batch_alter_table('admin', schema=None) as batch_op:
+        batch_op.create_index('ix_admin_email_lower', [sa.text('lower(email)')], unique=True)
+        batch_op.create_index('ix_admin_phone', ['phone'], unique=False)
+        batch_op.create_index('ix_admin_username', ['username'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('admin', schema=None) as batch_op:
+        batch_op.drop_index('ix_admin_username')
+        batch_op.drop_index('ix_admin_phone')
+        batch_op.drop_index('ix_admin_email_lower')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_phone')
+        batch_op.drop_index('ix_users_email_lower')
@@ -0,0 +1,59 @@
+"""stock reservations and one cart line per user and product
+
+Revision ID: b5e07c3d94f2
+Revises: 8e4f2b9d1a67
+Create Date: 2026-10-18 18:21:09.418532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e07c3d94f2'
+down_revision = '8e4f2b9d1a67'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_reservations',
+    sa.Column('res_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('prod_id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.order_id'], ),
+    sa.ForeignKeyConstraint(['prod_id'], ['product.prod_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('res_id')
+    )
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_reservations_order_id'), ['order_id'], unique=False)
+        batch_op.create_index('ix_stock_reservations_status_expires', ['status', 'expires_at'], unique=False)
+        batch_op.create_index('ix_stock_reservations_user_status', ['user_id', 'status'], unique=False)
+
+    # the old add-to-cart check could let duplicates in; keep each user's first line per product
+    op.execute("""
+        DELETE FROM carts WHERE cart_id NOT IN (
+            SELECT keep FROM (SELECT min(cart_id) AS keep FROM carts GROUP BY cart_user_id, cart_prod_id) AS firsts)
+    """)
+    with op.batch_alter_table('carts', schema=None) as batch_op:
+        batch_op.create_index('ux_carts_user_prod', ['cart_user_id', 'cart_prod_id'], unique=True)
+
+    op.execute("UPDATE product SET status = 'out of stock' WHERE quantity <= 0")
+
+
+def downgrade():
+    with op.batch_alter_table('carts', schema=None) as batch_op:
+        batch_op.drop_index('ux_carts_user_prod')
+
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_reservations_user_status')
+        batch_op.drop_index('ix_stock_reservations_status_expires')
+        batch_op.drop_index(batch_op.f('ix_stock_reservations_order_id'))
+
+    op.drop_table('stock_reservations')
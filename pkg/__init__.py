@@ -4,9 +4,35 @@ from flask_migrate import Migrate # type: ignore
 from flask_mail import Mail # type: ignore
 from config import config
 from pkg.models import db
+from pkg.cache import FragmentCache
+from pkg.paystack import PaystackClient
+from pkg.reconcile import PaymentReconciler
+from pkg.outbox import MailSender
+from pkg.passwords import PasswordHasher
+from pkg.images import ImagePipeline
+from pkg.dbpool import PoolMetrics
+from pkg.replicas import ReplicaRouter
+from pkg.profiler import QueryProfiler
+from pkg.metrics import Metrics
+from pkg.search import ProductSearch
+from pkg.snapshot import CatalogSnapshot
+from pkg.static_assets import AssetPipeline
 
 csrf = CSRFProtect()
 mail = Mail()
+fragment_cache = FragmentCache()
+paystack = PaystackClient()
+reconciler = PaymentReconciler()
+mail_sender = MailSender()
+hasher = PasswordHasher()
+image_pipeline = ImagePipeline()
+pool_metrics = PoolMetrics()
+replica_router = ReplicaRouter()
+query_profiler = QueryProfiler()
+metrics = Metrics()
+product_search = ProductSearch()
+catalog_snapshot = CatalogSnapshot()
+asset_pipeline = AssetPipeline()
 
 def create_app():
     from pkg import models
@@ -14,14 +40,38 @@ def create_app():
     app.config.from_object(config.Appconfig) #TO MAKE THE CONFIG ITEMS CREATED IN PKG/CONFIG.PY AVAILABLE
     app.config.from_pyfile('config.py', silent=True)
 
+    pool_metrics.init_app(app)  # before db.init_app: it picks the engine's pool class
     db.init_app(app)
+    replica_router.init_app(app)
+    metrics.init_app(app)
+    query_profiler.init_app(app)
     csrf.init_app(app)
     mail.init_app(app)
+    fragment_cache.init_app(app)
+    paystack.init_app(app)
+    reconciler.init_app(app)
+    mail_sender.init_app(app)
+    hasher.init_app(app)
+    image_pipeline.init_app(app)
+    product_search.init_app(app)
+    catalog_snapshot.init_app(app)
+    asset_pipeline.init_app(app)
     migrate = Migrate(app,db)
 
+    if not app.config['BACKGROUND_WORKERS_AFTER_FORK']:
+        start_background_workers(app)
+
     return app
 
+def start_background_workers(app):
+    # threads do not survive a fork, so under gunicorn this runs in each worker's post_fork
+    if app.config['PAYMENT_WORKER_INPROCESS']:
+        reconciler.start()
+    if app.config['MAIL_OUTBOX_INPROCESS']:
+        mail_sender.start()
+
 app = create_app()
 
 # from pkg import user_routes, admin_routes,models,forms
-from pkg.routes import user_routes, admin_routes
\ No newline at end of file
+from pkg.routes import user_routes, admin_routes
+from pkg import commands
\ No newline at end of file
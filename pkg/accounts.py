@@ -0,0 +1,64 @@
+import re
+
+from pkg.models import db
+
+
+# ************************************** LOGIN LOOKUP **************************************
+# Login accepts a username, email or phone in one box. Rather than OR-ing the three columns
+# (which no single index can serve) the input is classified first and resolved with one
+# equality lookup on the matching index: lower(email), the normalized phone or username.
+# Nothing is cached: the lookup is already one indexed query, and a cached identifier would
+# outlive changes to the account. Phones and usernames are not unique; the oldest account wins.
+
+PHONE_CHARS = re.compile(r'[\s\-().]')
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def normalize_phone(phone):
+    """Store and compare phones as local digits: '+234 802-222-2222' -> '08022222222'."""
+    digits = PHONE_CHARS.sub('', phone or '')
+    if digits.startswith('+234'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('234') and len(digits) == 13:
+        digits = '0' + digits[3:]
+    return digits
+
+
+def classify_identifier(identifier):
+    identifier = (identifier or '').strip()
+    if '@' in identifier:
+        return 'email', normalize_email(identifier)
+    phone = normalize_phone(identifier)
+    if phone.lstrip('+').isdigit() and 10 <= len(phone) <= 15:
+        return 'phone', phone
+    return 'username', identifier
+
+
+def _lookup(model, kind, value):
+    if kind == 'email':
+        query = model.query.filter(db.func.lower(model.email) == value)
+    elif kind == 'phone':
+        query = model.query.filter(model.phone == value)
+    else:
+        query = model.query.filter(model.username == value)
+    return query.order_by(model.__mapper__.primary_key[0]).first()
+
+
+def find_account(model, identifier):
+    """Return the Users/Admin row for a login identifier, or None."""
+    kind, value = classify_identifier(identifier)
+    account = _lookup(model, kind, value)
+    if account is None and kind == 'phone':
+        # a username of 10-15 digits reads as a phone; it is still someone's username
+        account = _lookup(model, 'username', (identifier or '').strip())
+    return account
+
+
+def email_taken(model, email):
+    return db.session.query(
+        model.query.filter(db.func.lower(model.email) == normalize_email(email)).exists()
+    ).scalar()
+# ************************************** LOGIN LOOKUP **************************************
@@ -0,0 +1,64 @@
+$(document).ready(() => {
+    $('#cart').on('click', function (e) {
+        if ($(this).is(':disabled')) {
+            e.preventDefault();
+            let loginModal = new bootstrap.Modal(document.getElementById('loginModal'));
+            loginModal.show();
+        }
+    });
+
+    // Cart buttons talk to the JSON cart API; without JS the links still work as before
+    const cartApi = (prodId, action, data) => $.ajax({
+        url: '/api/cart/' + prodId + '/' + action + '/', method: 'POST',
+        contentType: 'application/json', data: JSON.stringify(data || {}),
+        headers: {'X-CSRFToken': $('meta[name="csrf-token"]').attr('content')}
+    });
+    const showCart = (res) => {
+        $('[data-cart-count]').text(res.cart.units || '');
+        $('[data-cart-total]').text(res.cart.total);
+    };
+    const cartError = (button) => (xhr) => {
+        if (xhr.status === 400 || xhr.status === 401 || xhr.status === 409) {
+            alert((xhr.responseJSON && xhr.responseJSON.message) || 'Could not update your cart');
+        } else if (button) {
+            window.location = button.attr('href');
+        }
+    };
+
+    $(document).on('click', '[data-cart-add]', function (e) {
+        e.preventDefault();
+        const button = $(this);
+        cartApi(button.data('cart-add'), 'add').done((res) => {
+            showCart(res);
+            button.html('<i class="fas fa-check me-2"></i>In cart (' + res.line.quantity + ')');
+        }).fail(cartError(button));
+    });
+
+    $(document).on('change', '[data-cart-qty]', function () {
+        const input = $(this);
+        cartApi(input.data('cart-qty'), 'quantity', {quantity: parseInt(input.val(), 10)})
+            .done((res) => {
+                showCart(res);
+                if (!res.line.quantity) {
+                    input.closest('tr').remove();
+                }
+            }).fail(cartError());
+    });
+
+    $(document).on('click', '[data-cart-remove]', function (e) {
+        e.preventDefault();
+        const button = $(this);
+        cartApi(button.data('cart-remove'), 'remove').done((res) => {
+            showCart(res);
+            button.closest('tr').remove();
+            if (!res.cart.lines) {
+                window.location.reload();
+            }
+        }).fail(cartError(button));
+    });
+
+    // Enable product carousel controls
+    $('.carousel').carousel({
+        interval: 3000
+    });
+});
@@ -0,0 +1,197 @@
+import os, sqlite3, threading, time
+from collections import OrderedDict
+
+from flask import render_template, session
+from markupsafe import Markup
+
+
+# ************************************** CACHE BACKENDS **************************************
+# Every backend exposes the same small surface: get/set/delete for values with a TTL, plus
+# get_counter/incr for the per-product version numbers. Counters live apart from the values so
+# LRU eviction can never roll a version back and resurrect a stale fragment.
+
+class NullCache(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def get_counter(self, key):
+        return 0
+
+    def incr(self, key):
+        return 0
+
+
+class MemoryCache(object):
+    """In-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize=2048, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class SQLiteCache(object):
+    """Cache shared by every worker on a host, stored in a local SQLite file."""
+
+    def __init__(self, path, ttl=300):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _conn(self):
+        # one connection per thread and per process: a worker forked from a preloading master
+        # must not reuse the master's connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else None
+        self._conn().execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                             (key, str(value), expires))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def get_counter(self, key):
+        row = self._conn().execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key):
+        conn = self._conn()
+        conn.execute("INSERT INTO counters (key, value) VALUES (?, 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,))
+        return self.get_counter(key)
+# ************************************** CACHE BACKENDS **************************************
+
+
+# ************************************** FRAGMENT CACHE **************************************
+class FragmentCache(object):
+    """Caches rendered product fragments keyed by prod_id and the product's version number.
+
+    Admin writes call invalidate(prod_id), which bumps that product's version so only its
+    own fragments are re-rendered on the next request. The versions must be seen by every
+    worker, so with the per-process 'memory' backend they are kept in a SQLite file shared by
+    the workers on the host (CATALOG_CACHE_PATH); only the rendered HTML stays in process.
+    Across several hosts a card can be stale for up to CATALOG_CACHE_TTL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.versions = self.backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CATALOG_CACHE_BACKEND', 'memory')
+        ttl = app.config.get('CATALOG_CACHE_TTL', 300)
+
+        path = app.config.get('CATALOG_CACHE_PATH') or os.path.join(app.instance_path, 'catalog_cache.db')
+        if kind == 'memory':
+            self.backend = MemoryCache(maxsize=app.config.get('CATALOG_CACHE_SIZE', 2048), ttl=ttl)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.versions = SQLiteCache(path, ttl=ttl)
+        elif kind == 'sqlite':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = self.versions = SQLiteCache(path, ttl=ttl)
+        else:
+            self.backend = self.versions = NullCache()
+
+        app.jinja_env.globals['product_fragment'] = self.render
+        app.extensions['fragment_cache'] = self
+
+    def _key(self, template, prod_id, variant):
+        version = self.versions.get_counter(f"ver:{prod_id}")
+        return f"frag:{template}:{prod_id}:v{version}:{variant}"
+
+    def render(self, template, product):
+        # the storefront card differs for guests and logged-in shoppers
+        variant = 'in' if session.get('isonline') else 'out'
+        key = self._key(template, product.prod_id, variant)
+
+        html = self.backend.get(key)
+        if html is not None:
+            with self._lock:
+                self.hits += 1
+            return Markup(html)
+
+        with self._lock:
+            self.misses += 1
+        html = render_template(template, p=product)
+        self.backend.set(key, html)
+        return Markup(html)
+
+    def invalidate(self, prod_id):
+        self.versions.incr(f"ver:{prod_id}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0}
+# ************************************** FRAGMENT CACHE **************************************
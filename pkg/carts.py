@@ -0,0 +1,123 @@
+from decimal import Decimal
+
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from pkg.models import db, Carts, Product
+
+
+# ************************************** CART SERVICE **************************************
+# The cart and checkout pages are served from one joined query that also carries each line's
+# total and the cart total (a window sum), so no Product is lazy-loaded per line and nothing
+# is summed in Python. Checkout writes every submitted line with a single UPDATE.
+# Every total (cart page, checkout, JSON API and the order itself) is priced at the current
+# Product.amount; cart_amt only records the price a line was last written at.
+
+def cart_lines(user_id):
+    """Return (lines, total) for the user's cart.
+
+    Each line has cart_id, prod_id, prod_name, price (the current product price), cart_qty,
+    cart_amt (the price checkout stored) and line_total (price * cart_qty).
+    """
+    line_total = Product.amount * Carts.cart_qty
+    rows = db.session.execute(
+        select(Carts.cart_id, Product.prod_id, Product.prod_name, Product.amount.label('price'),
+               Carts.cart_qty, Carts.cart_amt, line_total.label('line_total'),
+               func.sum(line_total).over().label('cart_total'))
+        .join(Product, Product.prod_id == Carts.cart_prod_id)
+        .where(Carts.cart_user_id == user_id)
+        .order_by(Carts.cart_id)
+    ).all()
+
+    total = Decimal(str(rows[0].cart_total or 0)) if rows else Decimal('0.00')
+    return rows, total.quantize(Decimal('0.00'))
+
+
+def update_lines(user_id, cart_ids, quantities):
+    """Set the quantity of each given cart line and re-price it from the product table.
+
+    The submitted lines go out as one UPDATE ... SET cart_qty = CASE cart_id WHEN ... END,
+    which every backend we run on accepts, so the cost is one round trip whatever the cart
+    size. Lines that are not in the user's cart are ignored. Returns the rows updated.
+    """
+    qty_by_id = {}
+    for cart_id, qty in zip(cart_ids, quantities):
+        if str(cart_id).isdigit() and str(qty).isdigit():
+            qty_by_id[int(cart_id)] = max(int(qty), 1)
+    if not qty_by_id:
+        return 0
+
+    # the price always comes from the product row, never from the submitted form
+    price = (select(Product.amount).where(Product.prod_id == Carts.cart_prod_id)
+             .scalar_subquery())
+    result = db.session.execute(
+        update(Carts)
+        .where(Carts.cart_user_id == user_id, Carts.cart_id.in_(list(qty_by_id)))
+        .values(cart_qty=case(qty_by_id, value=Carts.cart_id), cart_amt=price)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def upsert_line(user_id, prod_id, quantity, add=True):
+    """Add `quantity` to the user's line for a product (or set it to `quantity`) in one statement.
+
+    INSERT ... SELECT from product, so a missing product, or one with less stock than the line
+    would then hold (what is in the cart already plus `quantity` when adding), writes nothing;
+    a line that exists already is updated through ux_carts_user_prod, and the update checks
+    the stock again so two adds racing each other cannot push the line past it either.
+    Returns False when nothing was written.
+    """
+    existing = (select(Carts.cart_qty)
+                .where(Carts.cart_user_id == user_id, Carts.cart_prod_id == prod_id)
+                .scalar_subquery())
+    wanted = func.coalesce(existing, 0) + quantity if add else literal(quantity)
+    source = (select(literal(user_id), Product.prod_id, literal(quantity), Product.amount)
+              .where(Product.prod_id == prod_id, Product.quantity >= wanted))
+    stock = select(Product.quantity).where(Product.prod_id == prod_id).scalar_subquery()
+    columns = ['cart_user_id', 'cart_prod_id', 'cart_qty', 'cart_amt']
+
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        # ON DUPLICATE KEY UPDATE takes no WHERE: keep the old quantity when over the stock
+        stmt = mysql.insert(Carts).from_select(columns, source)
+        qty = Carts.cart_qty + stmt.inserted.cart_qty if add else stmt.inserted.cart_qty
+        stmt = stmt.on_duplicate_key_update(cart_qty=case((qty <= stock, qty), else_=Carts.cart_qty),
+                                            cart_amt=stmt.inserted.cart_amt)
+    else:
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(Carts).from_select(columns, source)
+        qty = Carts.cart_qty + stmt.excluded.cart_qty if add else stmt.excluded.cart_qty
+        stmt = stmt.on_conflict_do_update(index_elements=[Carts.cart_user_id, Carts.cart_prod_id],
+                                          set_={'cart_qty': qty, 'cart_amt': stmt.excluded.cart_amt},
+                                          where=qty <= stock)
+    written = db.session.execute(stmt).rowcount > 0
+    db.session.commit()
+    return written
+
+
+def remove_line(user_id, prod_id):
+    result = db.session.execute(delete(Carts).where(Carts.cart_user_id == user_id, Carts.cart_prod_id == prod_id))
+    db.session.commit()
+    return result.rowcount > 0
+
+
+def cart_summary(user_id, prod_id=None):
+    """Line count, units and total (at current prices) of the user's cart in one aggregate,
+    plus the quantity of `prod_id` when given."""
+    row = db.session.execute(
+        select(func.count(Carts.cart_id).label('lines'),
+               func.coalesce(func.sum(Carts.cart_qty), 0).label('units'),
+               func.coalesce(func.sum(Carts.cart_qty * Product.amount), 0).label('total'),
+               func.coalesce(func.sum(case((Carts.cart_prod_id == prod_id, Carts.cart_qty), else_=0)), 0)
+               .label('quantity'))
+        .join(Product, Product.prod_id == Carts.cart_prod_id)
+        .where(Carts.cart_user_id == user_id)
+    ).one()
+    summary = {'lines': row.lines, 'units': int(row.units),
+               'total': str(Decimal(str(row.total)).quantize(Decimal('0.00')))}
+    if prod_id is not None:
+        summary['quantity'] = int(row.quantity)
+    return summary
+# ************************************** CART SERVICE **************************************
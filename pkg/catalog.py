@@ -0,0 +1,136 @@
+import base64, threading, time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, select, tuple_, update
+
+from pkg.models import db, Category, Product
+from pkg.readmodels import product_rows, product_views
+from pkg.snapshot import current_snapshot
+
+
+# ************************************** CATALOG PAGINATION **************************************
+# The storefront is paged with a keyset (seek) cursor on (dateadded, prod_id) instead of
+# OFFSET, so every page is an index range scan on ix_product_dateadded_prod_id no matter how
+# deep the shopper scrolls. Pages are read as ProductViews, images included, in one query,
+# or straight from the mapped catalog snapshot when CATALOG_SNAPSHOT is on.
+
+def encode_cursor(product):
+    raw = f"{product.dateadded.isoformat()}|{product.prod_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        stamp, prod_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(stamp), int(prod_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid catalog cursor')
+
+
+def catalog_page(after=None, per_page=24, cat_id=None):
+    """Return (products, next_cursor) for one page of the catalog, newest first."""
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        products = snapshot.page(decode_cursor(after) if after else None, per_page + 1, cat_id)
+        return _with_cursor(products, per_page)
+
+    query = product_rows()
+
+    if cat_id is not None:
+        # equality on the leading column keeps this on ix_product_cat_dateadded_prod_id
+        query = query.where(Product.cat_id == cat_id)
+
+    if after:
+        dateadded, prod_id = decode_cursor(after)
+        query = query.where(tuple_(Product.dateadded, Product.prod_id) < (dateadded, prod_id))
+
+    # fetch one extra row to know whether another page exists without a COUNT(*)
+    products = product_views(query.order_by(Product.dateadded.desc(), Product.prod_id.desc()).limit(per_page + 1))
+    return _with_cursor(products, per_page)
+
+
+def _with_cursor(products, per_page):
+    next_cursor = None
+    if len(products) > per_page:
+        products = products[:per_page]
+        next_cursor = encode_cursor(products[-1])
+
+    return products, next_cursor
+# ************************************** CATALOG PAGINATION **************************************
+
+
+# ************************************** CATEGORY FACETS **************************************
+# Category.product_count is a counter kept in step with product inserts, deletes and moves
+# between categories, written in the same flush as the product change. Facet counts are then
+# a read of the few category rows instead of a GROUP BY over every product. Bulk loads that
+# bypass the ORM should be followed by `flask recount-categories`.
+
+def _bump(connection, cat_id, delta):
+    if cat_id is not None:
+        connection.execute(update(Category.__table__).where(Category.__table__.c.cat_id == cat_id)
+                           .values(product_count=Category.__table__.c.product_count + delta))
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, product):
+    _bump(connection, product.cat_id, 1)
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, product):
+    _bump(connection, product.cat_id, -1)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, product):
+    history = inspect(product).attrs.cat_id.history
+    for cat_id in history.deleted or ():
+        _bump(connection, cat_id, -1)
+    for cat_id in history.added or ():
+        _bump(connection, cat_id, 1)
+
+
+def recount_categories():
+    """Recompute every category's product_count from the product table."""
+    table = Category.__table__
+    counted = (select(func.count(Product.prod_id)).where(Product.cat_id == table.c.cat_id)
+               .scalar_subquery())
+    db.session.execute(update(table).values(product_count=counted))
+    db.session.commit()
+    forget_categories()
+    return db.session.execute(select(func.count()).select_from(table)).scalar()
+
+
+def category_facets():
+    """Every category with its product count, by name."""
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return snapshot.categories
+    return db.session.execute(
+        select(Category.cat_id, Category.cat_name, Category.product_count).order_by(Category.cat_name)
+    ).all()
+
+
+# the category list behind the admin dropdowns and search only changes with a migration or a
+# recount, so it is read once per CATEGORY_CACHE_SECONDS per process (as plain rows, which
+# stay usable after the session that loaded them is gone)
+_cached = {'rows': None, 'at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def category_list():
+    now = time.monotonic()
+    if _cached['rows'] is None or now - _cached['at'] >= current_app.config['CATEGORY_CACHE_SECONDS']:
+        rows = db.session.execute(
+            select(Category.cat_id, Category.cat_name).order_by(Category.cat_name)).all()
+        with _cache_lock:
+            _cached['rows'], _cached['at'] = rows, now
+    return _cached['rows']
+
+
+def forget_categories():
+    with _cache_lock:
+        _cached['rows'] = None
+# ************************************** CATEGORY FACETS **************************************
@@ -0,0 +1,125 @@
+import signal
+
+import click
+
+from pkg import app, reconciler, image_pipeline, mail_sender, catalog_snapshot, asset_pipeline
+from pkg.catalog import recount_categories
+from pkg.history import rebuild_spend
+from pkg.sales import rebuild_sales
+from pkg.models import db
+
+
+# ************************************** PAYMENTS **************************************
+@app.cli.command('reconcile-payments')
+@click.option('--once', is_flag=True, help='Settle one batch and sweep once, then exit.')
+def reconcile_payments(once):
+    """Run the payment reconciliation worker."""
+    if once:
+        swept = reconciler.sweep()
+        handled = reconciler.run_once()
+        click.echo(f'Queued {swept} stale payment(s) for verification, settled {handled} job(s).')
+        return
+
+    signal.signal(signal.SIGTERM, lambda *args: reconciler.stop())
+    click.echo('Payment reconciliation worker running, Ctrl+C to stop.')
+    try:
+        reconciler.run_forever()
+    except KeyboardInterrupt:
+        pass
+# ************************************** PAYMENTS **************************************
+
+
+# ************************************** MAIL **************************************
+@app.cli.command('send-mail')
+@click.option('--once', is_flag=True, help='Send one batch from the outbox, then exit.')
+def send_mail(once):
+    """Run the mail outbox sender."""
+    if once:
+        handled = mail_sender.run_once()
+        click.echo(f'Handled {handled} queued email(s).')
+        return
+
+    signal.signal(signal.SIGTERM, lambda *args: mail_sender.stop())
+    click.echo('Mail sender running, Ctrl+C to stop.')
+    try:
+        mail_sender.run_forever()
+    except KeyboardInterrupt:
+        pass
+# ************************************** MAIL **************************************
+
+
+# ************************************** IMAGES **************************************
+@app.cli.command('process-images')
+def process_images():
+    """Build resized variants for product images that do not have them yet."""
+    queued = image_pipeline.process_pending()
+    if image_pipeline.workers:
+        image_pipeline.pool.shutdown(wait=True)
+    click.echo(f'Processed {queued} image(s).')
+
+
+@app.cli.command('gc-images')
+def gc_images():
+    """Delete product image files that no Image row references."""
+    removed = image_pipeline.collect_garbage()
+    click.echo(f'Removed {removed} unreferenced file(s).')
+
+
+@app.cli.command('dedupe-images')
+def dedupe_images():
+    """Rename randomly named uploads to content hashes and rebuild their variants."""
+    renamed = image_pipeline.rehash_legacy()
+    queued = image_pipeline.process_pending()
+    if image_pipeline.workers:
+        image_pipeline.pool.shutdown(wait=True)
+    removed = image_pipeline.collect_garbage()
+    click.echo(f'Renamed {renamed} image(s), processed {queued}, removed {removed} old file(s).')
+# ************************************** IMAGES **************************************
+
+
+# ************************************** SPEND SUMMARY **************************************
+@app.cli.command('rebuild-spend')
+def rebuild_spend_command():
+    """Recompute the per-user spend summary from paid payments."""
+    count = rebuild_spend()
+    click.echo(f'Rebuilt spend summary from {count} paid payment(s).')
+# ************************************** SPEND SUMMARY **************************************
+
+
+# ************************************** SALES ROLLUPS **************************************
+@app.cli.command('rebuild-sales')
+def rebuild_sales_command():
+    """Recompute the daily sales rollups behind the admin dashboard."""
+    count = rebuild_sales()
+    click.echo(f'Rebuilt sales rollups from {count} settled payment(s).')
+# ************************************** SALES ROLLUPS **************************************
+
+
+# ************************************** CATEGORY COUNTS **************************************
+@app.cli.command('recount-categories')
+def recount_categories_command():
+    """Recompute Category.product_count, e.g. after a bulk import of products."""
+    count = recount_categories()
+    click.echo(f'Recounted products for {count} categories.')
+    if catalog_snapshot.enabled:
+        catalog_snapshot.build()  # the snapshot carries the facet counts
+# ************************************** CATEGORY COUNTS **************************************
+
+
+# ************************************** CATALOG SNAPSHOT **************************************
+@app.cli.command('build-catalog-snapshot')
+def build_catalog_snapshot_command():
+    """Write the memory-mapped catalog snapshot the storefront reads with CATALOG_SNAPSHOT=1."""
+    version, count = catalog_snapshot.build()
+    click.echo(f'Wrote {count} product(s) to {catalog_snapshot.path} (version {version}).')
+# ************************************** CATALOG SNAPSHOT **************************************
+
+
+# ************************************** ASSETS **************************************
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify, fingerprint and precompress pkg/assets into pkg/static/dist."""
+    manifest = asset_pipeline.build()
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f'{name} -> {hashed}')
+# ************************************** ASSETS **************************************
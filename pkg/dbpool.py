@@ -0,0 +1,101 @@
+import threading, time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+# ************************************** CONNECTION POOL **************************************
+# The pool itself is configured by SQLALCHEMY_ENGINE_OPTIONS (see config.engine_options).
+# PoolMetrics swaps in a QueuePool that times every checkout, so a pool that is too small
+# for the worker's threads shows up as wait time instead of as mysteriously slow requests.
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection."""
+
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(time.perf_counter() - started)
+
+
+class PoolMetrics(object):
+    """Checkout wait times and pool occupancy for the app's engine.
+
+    init_app must run before db.init_app so the engine is built with TimedQueuePool.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._waits = deque(maxlen=5000)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        url = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        # in-memory sqlite needs its single shared connection, leave its pool alone
+        if url not in ('sqlite://', 'sqlite:///:memory:'):
+            options.setdefault('poolclass', TimedQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        TimedQueuePool.metrics = self
+
+        self.statement_timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+        self.is_mysql = url.startswith('mysql')
+        event.listen(TimedQueuePool, 'connect', self._on_connect)
+        event.listen(TimedQueuePool, 'invalidate', self._on_invalidate)
+        app.extensions['pool_metrics'] = self
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+        if self.is_mysql and self.statement_timeout:
+            # postgres gets its statement_timeout from connect_args; MySQL drivers have no
+            # common option for it, so set it on each new session
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION max_execution_time = {int(self.statement_timeout)}")
+            cursor.close()
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        # pre-ping failures and connections lost mid-request, e.g. after a failover
+        self.invalidated += 1
+
+    def record(self, seconds):
+        with self._lock:
+            self._waits.append(seconds)
+            self.checkouts += 1
+
+    def stats(self):
+        from pkg.models import db
+
+        with self._lock:
+            samples = sorted(self._waits)
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3) if samples else 0.0
+
+        pool = db.engine.pool
+        occupancy = {}
+        if isinstance(pool, QueuePool):
+            occupancy = {'size': pool.size(), 'checked_out': pool.checkedout(),
+                         'overflow': pool.overflow(), 'idle': pool.checkedin()}
+        return {'pool': type(pool).__name__, **occupancy, 'checkouts': self.checkouts,
+                'timeouts': self.timeouts, 'connects': self.connects,
+                'invalidated': self.invalidated, 'wait_p50_ms': pct(0.50),
+                'wait_p95_ms': pct(0.95), 'wait_p99_ms': pct(0.99),
+                'wait_max_ms': round(samples[-1] * 1000, 3) if samples else 0.0}
+# ************************************** CONNECTION POOL **************************************
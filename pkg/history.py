@@ -0,0 +1,135 @@
+import base64, json
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import exists, select, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from pkg.models import db, History, Payment, Product, UserSpend
+
+
+# ************************************** PURCHASE HISTORY **************************************
+# History is read newest first with a keyset cursor on (date, id), served by
+# ix_history_user_date (InnoDB and PostgreSQL append the primary key to the index, so the tie
+# break on id comes free). The product name is joined in, so a page is one query. The export
+# walks the same order through a server-side cursor and never holds the whole history.
+# Lines of orders whose payment failed stay in the table (the payment can still recover) and
+# are left out here, checked per row against ix_payment_pay_order.
+
+def _history_query(user_id):
+    failed = exists().where(Payment.pay_order == History.order_id, Payment.pay_status == 'failed')
+    return (select(History.id, History.date, History.order_id, History.price, History.quantity,
+                   History.amt_payable, History.total, Product.prod_name)
+            .outerjoin(Product, Product.prod_id == History.prod_id)
+            .where(History.user_id == user_id, ~failed)
+            .order_by(History.date.desc(), History.id.desc()))
+
+
+def encode_cursor(row):
+    raw = f"{row.date.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        stamp, hist_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(stamp), int(hist_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid history cursor')
+
+
+def history_page(user_id, after=None, per_page=50):
+    """Return (rows, next_cursor) for one page of the user's purchases, newest first."""
+    query = _history_query(user_id)
+    if after:
+        query = query.where(tuple_(History.date, History.id) < decode_cursor(after))
+
+    rows = db.session.execute(query.limit(per_page + 1)).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def row_to_dict(row):
+    return {'id': row.id, 'order_id': row.order_id, 'product': row.prod_name,
+            'price': str(row.price), 'quantity': row.quantity, 'amt_payable': str(row.amt_payable),
+            'total': str(row.total), 'date': row.date.isoformat()}
+
+
+def iter_history_json(user_id, chunk_size=500):
+    """Yield the user's whole history as a JSON array, a chunk of rows at a time."""
+    result = db.session.execute(_history_query(user_id).execution_options(yield_per=chunk_size))
+    yield '['
+    first = True
+    for rows in result.partitions():
+        body = ','.join(json.dumps(row_to_dict(row)) for row in rows)
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+# ************************************** PURCHASE HISTORY **************************************
+
+
+# ************************************** SPEND SUMMARY **************************************
+# user_spend holds a 'lifetime' row and one row per month for each buyer. Settlement adds a
+# paid payment to both with an upsert, so totals never need a scan of history or payments.
+
+LIFETIME = 'lifetime'
+
+
+def upsert_totals(model, keys, rows):
+    """Insert rows into a rollup table, adding onto the row with the same keys if it exists."""
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    for start in range(0, len(rows), 500):
+        chunk = rows[start:start + 500]
+        columns = [c for c in chunk[0] if c not in keys]
+        if dialect == 'mysql':
+            stmt = mysql.insert(table).values(chunk)
+            stmt = stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in columns})
+        else:
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c[k] for k in keys],
+                                              set_={c: table.c[c] + stmt.excluded[c] for c in columns})
+        db.session.execute(stmt)
+
+
+def record_spend(payments):
+    """Add newly paid payments to their buyers' monthly and lifetime totals (no commit)."""
+    totals = defaultdict(lambda: [Decimal('0.00'), 0])
+    for pay in payments:
+        amount = Decimal(str(pay.pay_actual or pay.pay_amt or 0))
+        month = (pay.pay_date or datetime.utcnow()).strftime('%Y-%m')
+        for period in (month, LIFETIME):
+            totals[(pay.pay_user, period)][0] += amount
+            totals[(pay.pay_user, period)][1] += 1
+
+    rows = [{'user_id': user_id, 'period': period, 'amount': amount, 'orders': orders}
+            for (user_id, period), (amount, orders) in totals.items()]
+    upsert_totals(UserSpend, ['user_id', 'period'], rows)
+
+
+def rebuild_spend():
+    """Recompute user_spend from paid payments, e.g. after first deploying the table."""
+    db.session.query(UserSpend).delete()
+    payments = db.session.execute(
+        select(Payment.pay_user, Payment.pay_date, Payment.pay_actual, Payment.pay_amt)
+        .where(Payment.pay_status == 'paid')
+    ).all()
+    record_spend(payments)
+    db.session.commit()
+    return len(payments)
+
+
+def spend_summary(user_id, months=12):
+    """Return {'lifetime': row or None, 'months': latest monthly rows, newest first}."""
+    rows = (UserSpend.query.filter(UserSpend.user_id == user_id)
+            .order_by(UserSpend.period.desc()).limit(months + 1).all())
+    lifetime = next((r for r in rows if r.period == LIFETIME), None)
+    return {'lifetime': lifetime, 'months': [r for r in rows if r.period != LIFETIME][:months]}
+# ************************************** SPEND SUMMARY **************************************
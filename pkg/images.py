@@ -0,0 +1,263 @@
+import hashlib, json, os, threading, time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import send_from_directory, url_for
+from sqlalchemy import update
+
+from pkg.models import db, Image
+
+ALLOWED_FORMATS = ['.jpg', '.png', '.jpeg']
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+# ************************************** VARIANT BUILDER **************************************
+# Runs in a worker process: everything it needs comes in as plain arguments and it only
+# touches files, never the database.
+
+def make_variants(src_path, out_dir, stem, sizes, formats, quality):
+    """Write resized copies of src_path and return (width, height, variants)."""
+    from PIL import Image as PILImage, ImageOps # type: ignore
+
+    with PILImage.open(src_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+        width, height = original.size
+
+        variants = {}
+        for name, max_width in sizes.items():
+            copy = original.copy()
+            if copy.width > max_width:
+                copy = copy.resize((max_width, round(copy.height * max_width / copy.width)),
+                                   PILImage.LANCZOS)
+            files = {}
+            for fmt in formats:
+                ext = 'jpg' if fmt == 'jpeg' else fmt
+                filename = f"{stem}_{name}.{ext}"
+                copy.save(os.path.join(out_dir, filename), fmt.upper(), quality=quality,
+                          optimize=True, **({'progressive': True} if fmt == 'jpeg' else {}))
+                files[ext] = filename
+            variants[name] = {'w': copy.width, 'h': copy.height, 'files': files}
+
+    return width, height, variants
+# ************************************** VARIANT BUILDER **************************************
+
+
+# ************************************** IMAGE PIPELINE **************************************
+class ImagePipeline(object):
+    """Content-addressed store for product images, with variants built in the background.
+
+    Uploads are streamed to disk while being hashed and stored as <sha256><ext>, so the same
+    photo uploaded for several products (or re-uploaded on update) is kept once. Image rows
+    are the reference count: a blob and its variants are deleted when no row points at them.
+    Because a name always means the same bytes, files are served as immutable.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.upload_dir = os.path.join(app.static_folder, 'products')
+        self.workers = app.config['IMAGE_WORKERS']
+        self.sizes = app.config['IMAGE_VARIANT_SIZES']
+        self.formats = app.config['IMAGE_VARIANT_FORMATS']
+        self.quality = app.config['IMAGE_QUALITY']
+        self.gc_grace = app.config['IMAGE_GC_GRACE']
+        app.add_url_rule('/media/products/<path:filename>', 'product_media', self.serve)
+        app.jinja_env.globals['image_srcset'] = image_srcset
+        app.jinja_env.globals['image_src'] = image_src
+        app.extensions['image_pipeline'] = self
+
+    @property
+    def pool(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def close(self, wait=True):
+        # only the process that created the pool may shut it down
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=wait)
+        self._pool = None
+
+    def validate(self, pics):
+        if len(pics) > 4:
+            raise ValueError('Maximum number file is 4')
+        for pic in pics:
+            _, ext = os.path.splitext(pic.filename)
+            if ext.lower() not in ALLOWED_FORMATS:
+                raise ValueError(f'Image format not supported! {pic.filename}')
+
+    def save(self, pic):
+        """Stream an upload to disk, hashing as it goes, and return its content-addressed name."""
+        _, ext = os.path.splitext(pic.filename)
+        ext = '.jpg' if ext.lower() == '.jpeg' else ext.lower()
+
+        digest = hashlib.sha256()
+        tmp = os.path.join(self.upload_dir, f".upload-{os.getpid()}-{threading.get_ident()}.part")
+        with open(tmp, 'wb') as out:
+            for chunk in iter(lambda: pic.stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = digest.hexdigest() + ext
+        path = os.path.join(self.upload_dir, name)
+        if os.path.exists(path):
+            os.remove(tmp)      # already stored: this upload is a duplicate
+        else:
+            os.replace(tmp, path)
+        return name
+
+    def submit(self, img):
+        """Queue variant generation for a committed Image row, reusing another row's if it exists."""
+        twin = Image.query.filter(Image.filename == img.filename, Image.variants.isnot(None)).first()
+        if twin is not None:
+            self._record(img.filename, (twin.width, twin.height, json.loads(twin.variants)))
+            return
+
+        filename = img.filename
+        args = (os.path.join(self.upload_dir, filename), self.upload_dir,
+                os.path.splitext(filename)[0], self.sizes, self.formats, self.quality)
+
+        if not self.workers:
+            try:
+                result = make_variants(*args)
+            except Exception as e:
+                self.app.logger.error("Image processing failed for %s: %s", filename, e)
+                return
+            self._record(filename, result)
+            return
+
+        future = self.pool.submit(make_variants, *args)
+        future.add_done_callback(lambda f: self._done(filename, f))
+
+    def _done(self, filename, future):
+        # runs on the pool's result thread, outside any request
+        with self.app.app_context():
+            try:
+                self._record(filename, future.result())
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error("Image processing failed for %s: %s", filename, e)
+            finally:
+                db.session.remove()
+
+    def _record(self, filename, result):
+        from pkg import catalog_snapshot, fragment_cache
+
+        width, height, variants = result
+        db.session.execute(update(Image).where(Image.filename == filename)
+                           .values(width=width, height=height, variants=json.dumps(variants)))
+        product_ids = db.session.execute(
+            db.select(Image.product_id).where(Image.filename == filename).distinct()).scalars().all()
+        db.session.commit()
+        # cards rendered before the variants existed point at the original upload
+        for product_id in product_ids:
+            fragment_cache.invalidate(product_id)
+        catalog_snapshot.refresh(product_ids)
+
+    def process_pending(self):
+        """Build variants for every image that has none yet (e.g. uploads from before a restart)."""
+        filenames = db.session.execute(
+            db.select(Image.filename).where(Image.variants.is_(None)).distinct()).scalars().all()
+        for filename in filenames:
+            self.submit(Image(filename=filename))
+        return len(filenames)
+
+    def _blob_files(self, filename, variants=None):
+        files = [filename]
+        for variant in (variants or {}).values():
+            files.extend(variant['files'].values())
+        return files
+
+    def release(self, images):
+        """Delete the files of blobs that no Image row references any more. Call after commit."""
+        removed = 0
+        for filename, variants in {(i.filename, i.variants) for i in images}:
+            if Image.query.filter_by(filename=filename).first() is not None:
+                continue
+            for name in self._blob_files(filename, json.loads(variants) if variants else None):
+                try:
+                    os.remove(os.path.join(self.upload_dir, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def collect_garbage(self):
+        """Remove files in the products folder that no Image row references.
+
+        Files younger than IMAGE_GC_GRACE seconds are kept so an upload whose row is not yet
+        committed is never collected.
+        """
+        referenced = set()
+        for filename, variants in db.session.execute(db.select(Image.filename, Image.variants)):
+            referenced.update(self._blob_files(filename, json.loads(variants) if variants else None))
+
+        cutoff = time.time() - self.gc_grace
+        removed = 0
+        for entry in os.scandir(self.upload_dir):
+            if entry.is_file() and entry.name not in referenced and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    def rehash_legacy(self):
+        """Move randomly named uploads to content-addressed names, merging duplicates."""
+        renamed = 0
+        for filename in db.session.execute(db.select(Image.filename).distinct()).scalars().all():
+            path = os.path.join(self.upload_dir, filename)
+            stem, ext = os.path.splitext(filename)
+            if len(stem) == 64 or not os.path.exists(path):
+                continue
+            with open(path, 'rb') as src:
+                name = self.save(_Upload(filename, src))
+            db.session.execute(update(Image).where(Image.filename == filename)
+                               .values(filename=name, width=None, height=None, variants=None))
+            renamed += 1
+        db.session.commit()
+        return renamed
+
+    def serve(self, filename):
+        response = send_from_directory(self.upload_dir, filename, max_age=IMMUTABLE_MAX_AGE,
+                                       etag=os.path.splitext(filename)[0])
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        return response
+
+
+class _Upload(object):
+    # the slice of werkzeug's FileStorage that save() uses
+    def __init__(self, filename, stream):
+        self.filename = filename
+        self.stream = stream
+# ************************************** IMAGE PIPELINE **************************************
+
+
+# ************************************** TEMPLATE HELPERS **************************************
+def _variants(img):
+    return json.loads(img.variants) if img.variants else {}
+
+
+def image_src(img, variant='card', ext='jpg'):
+    """URL of one variant, falling back to the original upload until variants exist."""
+    files = _variants(img).get(variant, {}).get('files', {})
+    return url_for('product_media', filename=files.get(ext, img.filename))
+
+
+def image_srcset(img, ext='jpg'):
+    """A srcset listing every variant in the given format, or '' before processing."""
+    variants = _variants(img)
+    entries = [f"{url_for('product_media', filename=v['files'][ext])} {v['w']}w"
+               for v in sorted(variants.values(), key=lambda v: v['w']) if ext in v['files']]
+    return ', '.join(entries)
+# ************************************** TEMPLATE HELPERS **************************************
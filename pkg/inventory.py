@@ -0,0 +1,190 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, event, insert, select, update
+
+from pkg.models import db, Product, StockReservation
+from pkg.replicas import RoutingSession
+
+
+IN_STOCK = 'in stock'
+OUT_OF_STOCK = 'out of stock'
+
+
+class OutOfStock(ValueError):
+    """Raised by reserve() when some products do not have the quantity asked for."""
+
+    def __init__(self, names):
+        self.names = names
+        super().__init__(f"Not enough stock left for: {', '.join(names)}")
+
+
+# ************************************** STOCK RESERVATION **************************************
+# Placing an order takes its stock straight away with a conditional
+#     UPDATE product SET quantity = quantity - n WHERE prod_id = ? AND quantity >= n
+# so two shoppers can never both get the last unit: the row lock serialises them and the
+# second UPDATE matches no row. Products are taken in prod_id order (no deadlocks between
+# carts) and as the order's last writes, so the row locks are held for as short as possible.
+# The stock sits in a 'held' StockReservation until the payment settles: paid commits it,
+# failed gives it back, and a hold older than STOCK_RESERVATION_TTL is given back by the
+# payment worker's sweep. A hold changes state with a conditional UPDATE, so a settlement
+# racing the sweep can only move it once. Product status flips to 'out of stock' in the same
+# statement that takes the last unit, and back when stock returns. A payment that settles
+# after its hold was given back takes the stock again; when it is gone by then the hold ends
+# 'short' instead of 'committed', and the sales dashboard lists the order for a person to sort out.
+
+def _take(prod_id, qty):
+    # status is assigned first so every backend (MySQL assigns left to right) sees the old quantity
+    result = db.session.execute(
+        update(Product)
+        .where(Product.prod_id == prod_id, Product.quantity >= qty)
+        .ordered_values((Product.status, case((Product.quantity - qty <= 0, OUT_OF_STOCK), else_=Product.status)),
+                        (Product.quantity, Product.quantity - qty))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _give_back(prod_id, qty):
+    db.session.execute(
+        update(Product)
+        .where(Product.prod_id == prod_id)
+        .ordered_values((Product.status, case((Product.status == OUT_OF_STOCK, IN_STOCK), else_=Product.status)),
+                        (Product.quantity, Product.quantity + qty))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _changed(prod_ids):
+    # product cards show the stock; their fragments are dropped once the change is committed
+    db.session.info.setdefault('stock_changed', set()).update(prod_ids)
+
+
+def _move(reservations, to_status):
+    """Move held reservations to `to_status`; returns the ones this call actually moved."""
+    moved = []
+    for res in reservations:
+        result = db.session.execute(
+            update(StockReservation)
+            .where(StockReservation.res_id == res.res_id, StockReservation.status == 'held')
+            .values(status=to_status)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            moved.append(res)
+    return moved
+
+
+def _restock(reservations):
+    totals = defaultdict(int)
+    for res in reservations:
+        totals[res.prod_id] += res.quantity
+    for prod_id in sorted(totals):
+        _give_back(prod_id, totals[prod_id])
+    _changed(totals)
+
+
+def _held(*criteria, limit=None):
+    query = (select(StockReservation.res_id, StockReservation.prod_id, StockReservation.quantity)
+             .where(StockReservation.status == 'held', *criteria)
+             .order_by(StockReservation.res_id))
+    if limit:
+        query = query.limit(limit)
+    if db.engine.dialect.name in ('postgresql', 'mysql'):
+        # two sweepers (or a sweep and a settlement) split the work instead of queueing
+        query = query.with_for_update(skip_locked=True)
+    return db.session.execute(query).all()
+
+
+def reserve(user_id, order_id, lines):
+    """Hold stock for an order's (prod_id, quantity) lines, in the caller's transaction.
+
+    Holds of the user's earlier checkouts stay: their payments may still go through. Only
+    the ones past their expiry are given back here, ahead of the sweep. Raises OutOfStock
+    (the caller rolls back) when a product does not have enough left.
+    """
+    wanted = defaultdict(int)
+    for prod_id, qty in lines:
+        if qty and qty > 0:
+            wanted[prod_id] += qty
+    if not wanted:
+        return
+
+    expired = StockReservation.expires_at <= datetime.utcnow()
+    _restock(_move(_held(StockReservation.user_id == user_id, expired), 'released'))
+
+    short = [prod_id for prod_id in sorted(wanted) if not _take(prod_id, wanted[prod_id])]
+    if short:
+        names = db.session.execute(select(Product.prod_name).where(Product.prod_id.in_(short))).scalars()
+        raise OutOfStock(list(names))
+
+    expires = datetime.utcnow() + timedelta(seconds=current_app.config['STOCK_RESERVATION_TTL'])
+    db.session.execute(insert(StockReservation),
+                       [{'prod_id': prod_id, 'order_id': order_id, 'user_id': user_id, 'quantity': qty,
+                         'expires_at': expires} for prod_id, qty in sorted(wanted.items())])
+    _changed(wanted)
+
+
+def commit_orders(order_ids):
+    """Make the holds of paid orders final."""
+    if not order_ids:
+        return
+    _move(_held(StockReservation.order_id.in_(order_ids)), 'committed')
+
+    # a payment that lands after its hold expired: take the stock again if it is still there
+    late = db.session.execute(
+        select(StockReservation)
+        .where(StockReservation.order_id.in_(order_ids), StockReservation.status == 'released')
+        .order_by(StockReservation.prod_id)
+    ).scalars().all()
+    for res in late:
+        if _take(res.prod_id, res.quantity):
+            res.status = 'committed'
+        else:
+            res.status = 'short'
+            current_app.logger.error("Order %s was paid after its stock hold expired and product %s "
+                                     "no longer has %s in stock", res.order_id, res.prod_id, res.quantity)
+    _changed({res.prod_id for res in late})
+
+
+def short_orders(limit=50):
+    """Paid order lines whose stock was gone by the time the payment settled, newest first."""
+    return db.session.execute(
+        select(StockReservation.order_id, StockReservation.quantity, StockReservation.created,
+               Product.prod_name)
+        .join(Product, Product.prod_id == StockReservation.prod_id)
+        .where(StockReservation.status == 'short')
+        .order_by(StockReservation.res_id.desc())
+        .limit(limit)
+    ).all()
+
+
+def release_orders(order_ids):
+    """Give back the stock held by orders whose payment failed."""
+    if order_ids:
+        _restock(_move(_held(StockReservation.order_id.in_(order_ids)), 'released'))
+
+
+def release_expired(limit=500):
+    """Give back holds past their expiry. Returns the number released."""
+    released = _move(_held(StockReservation.expires_at <= datetime.utcnow(), limit=limit), 'released')
+    _restock(released)
+    return len(released)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_cards(session):
+    prod_ids = session.info.pop('stock_changed', None)
+    if prod_ids:
+        from pkg import catalog_snapshot, fragment_cache
+
+        for prod_id in prod_ids:
+            fragment_cache.invalidate(prod_id)
+        catalog_snapshot.refresh(prod_ids)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('stock_changed', None)
+# ************************************** STOCK RESERVATION **************************************
@@ -0,0 +1,360 @@
+import glob, json, os, threading, time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no gunicorn there, so no workers to coordinate either
+    fcntl = None
+
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint.'),
+    'http_request_db_seconds': ('histogram', 'Database time spent per request, by endpoint.'),
+    'http_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'gateway_request_duration_seconds': ('histogram', 'Calls to external gateways, retries included.'),
+}
+
+
+# ************************************** METRICS REGISTRY **************************************
+# Each request thread records into its own shard, so the hot path is a couple of dict updates
+# with no lock. A scrape merges the shards of this process; with METRICS_DIR set every worker
+# also writes its merged totals to <dir>/<pid>-<start>.json every METRICS_FLUSH_INTERVAL
+# seconds from a background thread, and /metrics (served by any worker) adds up all the files.
+# Counters and histograms of workers that have exited are kept, so totals never go backwards:
+# a worker folds its file into exited.json as it exits (a killed worker's file is folded by
+# the next scrape), so the directory holds one file per live worker plus that one. Their
+# in-flight gauge is dropped.
+
+class _Shard(object):
+    __slots__ = ('counters', 'histograms', 'gauges')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+
+def _key(name, labels):
+    return (name,) + tuple(sorted(labels.items()))
+
+
+class Metrics(object):
+    """Prometheus-style request, database and gateway metrics served at /metrics."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.buckets = DEFAULT_BUCKETS
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._flush_lock = threading.Lock()
+        self._retired = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['METRICS_ENABLED']
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.token = app.config['METRICS_TOKEN']
+        self._file = None
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.endpoint)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # ---- recording -------------------------------------------------------------------------
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def add_gauge(self, name, value, **labels):
+        gauges = self._shard().gauges
+        key = _key(name, labels)
+        gauges[key] = gauges.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            entry = histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                entry[i] += 1
+                break
+        entry[-2] += seconds
+        entry[-1] += 1
+
+    def observe_gateway(self, gateway, operation, outcome, seconds):
+        if self.enabled:
+            self.observe('gateway_request_duration_seconds', seconds, gateway=gateway,
+                         operation=operation, outcome=outcome)
+
+    # ---- request hooks ---------------------------------------------------------------------
+    def _before(self):
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        g._metrics_started = time.perf_counter()
+        g._metrics_db = 0.0
+        self.add_gauge('http_requests_in_flight', 1)
+
+    def _after(self, response):
+        started = g.get('_metrics_started')
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.inc('http_requests_total', endpoint=endpoint, method=request.method,
+                     status=str(response.status_code))
+            self.observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+            self.observe('http_request_db_seconds', g.get('_metrics_db', 0.0), endpoint=endpoint)
+        return response
+
+    def _teardown(self, exc):
+        if g.pop('_metrics_started', None) is not None:
+            self.add_gauge('http_requests_in_flight', -1)
+
+    # ---- aggregation -----------------------------------------------------------------------
+    def snapshot(self):
+        """This process's totals, merged across request threads."""
+        counters, histograms, gauges = {}, {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict() copies under the GIL, so a shard being written to is read consistently
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, value in dict(shard.gauges).items():
+                gauges[key] = gauges.get(key, 0) + value
+            for key, entry in dict(shard.histograms).items():
+                merged = histograms.setdefault(key, [0] * len(entry))
+                for i, v in enumerate(list(entry)):
+                    merged[i] += v
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def _path(self):
+        if self._file is None or not self._file.startswith(os.path.join(self.directory, f'{os.getpid()}-')):
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}.json')
+        return self._file
+
+    def _start_flusher(self):
+        # one per worker process, started by its first request (threads do not survive fork)
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    self.app.logger.warning("Could not write metrics: %s", e)
+
+        threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+
+    def flush(self):
+        """Write this process's totals for the other workers' /metrics to pick up."""
+        with self._flush_lock:
+            if not self._retired:
+                _write(self._path(), {'pid': os.getpid(), **_dump(self.snapshot())})
+
+    def retire(self):
+        """Fold this worker's totals into exited.json; call once as the worker exits."""
+        with self._flush_lock:
+            if self._retired:
+                return
+            self._retired = True
+            path = self._path()
+            _write(path, {'pid': os.getpid(), **_dump(self.snapshot())})
+        fold_files(self.directory, [path])
+
+    def collect(self):
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush()
+        # files of workers that died without retiring (killed, crashed)
+        dead = [path for path, data in _read_all(self.directory)
+                if data.get('pid') is not None and not _alive(data['pid'])]
+        if dead:
+            fold_files(self.directory, dead)
+
+        merged = {'counters': {}, 'histograms': {}, 'gauges': {}}
+        with _locked(self.directory, shared=True):
+            for path, data in _read_all(self.directory):
+                _merge(merged, data, gauges=data.get('pid') is not None and _alive(data['pid']))
+        return merged
+
+    def render(self):
+        data = self.collect()
+        series = {}
+        for kind in ('counters', 'gauges', 'histograms'):
+            for key, value in data[kind].items():
+                series.setdefault(key[0], []).append((dict(key[1:]), value))
+
+        lines = []
+        for name in sorted(series):
+            kind, text = HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series[name], key=lambda s: sorted(s[0].items())):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {value[-1]}')
+                lines.append(f'{name}_sum{_labels(labels)} {round(value[-2], 6)}')
+                lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def endpoint(self):
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            return Response('Unauthorized\n', 401, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+# ************************************** METRICS REGISTRY **************************************
+
+
+def _escape(value):
+    # label values in the text exposition format: backslash, double quote and newline
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    body = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return '{' + body + '}'
+
+
+# ---- worker files ----------------------------------------------------------------------------
+EXITED = 'exited.json'
+
+
+def _dump(totals):
+    return {kind: [[list(k), v] for k, v in totals[kind].items()]
+            for kind in ('counters', 'histograms', 'gauges')}
+
+
+def _write(path, data):
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as out:
+        json.dump(data, out)
+    os.replace(tmp, path)
+
+
+def _read_all(directory):
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as src:
+                yield path, json.load(src)
+        except (OSError, ValueError):
+            continue
+
+
+def _merge(merged, data, gauges=True):
+    for kind in ('counters', 'histograms', 'gauges'):
+        if kind == 'gauges' and not gauges:
+            continue
+        for key, value in data.get(kind, ()):
+            key = tuple(tuple(p) if isinstance(p, list) else p for p in key)
+            if kind == 'histograms':
+                target = merged[kind].setdefault(key, [0] * len(value))
+                for i, v in enumerate(value):
+                    target[i] += v
+            else:
+                merged[kind][key] = merged[kind].get(key, 0) + value
+
+
+@contextmanager
+def _locked(directory, shared=False):
+    """Folding holds the directory exclusively, so a scrape never counts a file twice."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fold_files(directory, paths):
+    """Add the counters and histograms in `paths` to exited.json and delete the files."""
+    with _locked(directory):
+        exited = os.path.join(directory, EXITED)
+        merged = {'counters': {}, 'histograms': {}, 'gauges': {}}
+        for path in [exited, *paths]:
+            try:
+                with open(path) as src:
+                    _merge(merged, json.load(src), gauges=False)
+            except (OSError, ValueError):
+                continue
+        _write(exited, _dump(merged))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_directory(directory):
+    """Drop the files of a previous server run; call once before the workers start."""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get('_metrics_db') is not None:
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('_metrics_started')
+    if started and has_app_context():
+        elapsed = time.perf_counter() - started.pop()
+        if g.get('_metrics_db') is not None:
+            g._metrics_db += elapsed
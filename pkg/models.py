@@ -1,7 +1,9 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy # type: ignore
 
-db = SQLAlchemy()
+from pkg.replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def utc_now_no_seconds():
     return datetime.utcnow().replace(second=0, microsecond=0)
@@ -16,6 +18,13 @@ class Admin(db.Model):
     password = db.Column(db.String(200), nullable=False)
     date_reg = db.Column(db.DateTime, default=datetime.utcnow) # type: ignore
 
+    # login resolves the identifier to one of these with a single equality lookup
+    __table_args__ = (
+        db.Index('ix_admin_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_admin_phone', 'phone'),
+        db.Index('ix_admin_username', 'username'),
+    )
+
 
 class Users(db.Model):
     __tablename__ = 'users'
@@ -29,6 +38,11 @@ class Users(db.Model):
     pwd = db.Column(db.String(255),nullable=False)
     regdate = db.Column(db.DateTime, default=datetime.utcnow) # type: ignore
 
+    __table_args__ = (
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_users_phone', 'phone'),
+    )
+
 
 class Product(db.Model):
     __tablename__ = 'product'
@@ -36,26 +50,40 @@ class Product(db.Model):
     prod_name = db.Column(db.String(100), index=True)
     amount = db.Column(db.Float)
     status = db.Column(db.String(100))
-    category = db.Column(db.String(100))
+    cat_id = db.Column(db.Integer, db.ForeignKey('category.cat_id'))
     quantity = db.Column(db.Integer)
     dateadded = db.Column(db.DateTime, default=datetime.utcnow) # type: ignore
+    updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # lets search indexes catch up
 
     # one-to-many relationship: one product → many images
     images = db.relationship('Image', backref='product', lazy=True, cascade="all, delete-orphan")
+    # a handful of rows, joined in so cards and search never lazy load it per product
+    category = db.relationship('Category', lazy='joined')
+
+    # composite indexes backing the keyset (seek) pagination of the storefront, overall and
+    # within one category (the second also serves as the cat_id foreign key index)
+    __table_args__ = (
+        db.Index('ix_product_dateadded_prod_id', 'dateadded', 'prod_id'),
+        db.Index('ix_product_cat_dateadded_prod_id', 'cat_id', 'dateadded', 'prod_id'),
+    )
 
 
 
 class Image(db.Model):
     __tablename__ = 'images'
     img_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    filename = db.Column(db.String(255), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.prod_id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)  # <sha256><ext>, shared by duplicate uploads
+    product_id = db.Column(db.Integer, db.ForeignKey('product.prod_id'), nullable=False, index=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(db.Text, nullable=True)  # JSON: {"card": {"w": 480, "h": 360, "files": {"webp": ..., "jpg": ...}}, ...}
 
 
 class Category(db.Model):
     __tablename__ = 'category'
     cat_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     cat_name = db.Column(db.String(200), nullable=False)
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # kept by pkg.catalog
 
 
 
@@ -71,6 +99,11 @@ class Carts(db.Model):
     cart = db.relationship('Users', backref='mycart')
     cart = db.relationship('Product',backref='incart')
 
+    # a product appears at most once in a user's cart; also serves the per-user cart lookups
+    __table_args__ = (
+        db.Index('ux_carts_user_prod', 'cart_user_id', 'cart_prod_id', unique=True),
+    )
+
 class Orders(db.Model):
     __tablename__ = 'orders'
     order_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -95,9 +128,9 @@ class Payment(db.Model):
     __tablename__ = 'payment'
     pay_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     pay_user = db.Column(db.Integer, db.ForeignKey('users.user_id'))
-    pay_order = db.Column(db.Integer, db.ForeignKey('orders.order_id'))
+    pay_order = db.Column(db.Integer, db.ForeignKey('orders.order_id'), index=True)
     pay_amt = db.Column(db.Float(), nullable=True)
-    pay_ref = db.Column(db.String(200), nullable=False)
+    pay_ref = db.Column(db.String(200), nullable=False, index=True)
     pay_date = db.Column(db.DateTime, default=datetime.utcnow) # type: ignore
     pay_status = db.Column(db.Enum('pending','paid','failed', name='pay_status'), default='pending')
     pay_actual = db.Column(db.Float(), nullable=True)
@@ -110,6 +143,10 @@ class Payment(db.Model):
     paid_user = db.relationship('Users', backref='mypayments')
     paid_order = db.relationship('Orders', backref='paymentorder')
 
+    __table_args__ = (
+        db.Index('ix_payment_status_date', 'pay_status', 'pay_date'),
+    )
+
 
 class History(db.Model):
     __tablename__ = 'history'
@@ -124,6 +161,96 @@ class History(db.Model):
     total = db.Column(db.Numeric(10,2), nullable=False, default=0.00)
     
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=True, index=True)
     user = db.relationship('Users', backref='history')
     product = db.relationship('Product', backref='hist')
 
+    __table_args__ = (
+        db.Index('ix_history_user_date', 'user_id', 'date'),
+    )
+
+
+class StockReservation(db.Model):
+    __tablename__ = 'stock_reservations'
+
+    res_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    prod_id = db.Column(db.Integer, db.ForeignKey('product.prod_id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='held')  # held -> committed | released (| short: paid, stock gone)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stock_reservations_status_expires', 'status', 'expires_at'),
+        db.Index('ix_stock_reservations_user_status', 'user_id', 'status'),
+    )
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+
+    msg_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued -> sent | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_run_after', 'status', 'run_after'),
+    )
+
+
+class PaymentJob(db.Model):
+    __tablename__ = 'payment_jobs'
+
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'webhook' carries the event, 'verify' asks Paystack
+    pay_ref = db.Column(db.String(200), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_payment_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+
+class UserSpend(db.Model):
+    __tablename__ = 'user_spend'
+
+    # one row per user per month ('2026-10') plus a 'lifetime' row, kept current as payments settle
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    amount = db.Column(db.Numeric(12,2), nullable=False, default=0.00)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SalesDaily(db.Model):
+    __tablename__ = 'sales_daily'
+
+    # one row per day (the payment's date), kept current as payments settle; see pkg/sales.py
+    day = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Numeric(14,2), nullable=False, default=0.00)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    paid = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ProductSalesDaily(db.Model):
+    __tablename__ = 'product_sales_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    prod_id = db.Column(db.Integer, db.ForeignKey('product.prod_id'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14,2), nullable=False, default=0.00)
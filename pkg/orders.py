@@ -0,0 +1,77 @@
+import random
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from pkg.inventory import reserve
+from pkg.models import db, Carts, History, Orders, OrderDetails, Payment, Product
+
+
+# ************************************** ORDER PLACEMENT **************************************
+# An order is one unit of work: the cart lines are read with a single IN query, History and
+# OrderDetails are written as batched inserts and everything is committed once, so a failure
+# halfway through rolls the whole order back instead of leaving half-written rows behind.
+# The order's stock is reserved last, just before the commit (see pkg.inventory).
+
+def place_order(user_id, cart_ids):
+    """Turn the user's selected cart lines into an order and a pending payment.
+
+    Returns the payment reference, or None when none of the lines are in the user's cart.
+    Raises OutOfStock when a line asks for more than is left.
+    """
+    cart_ids = [int(c) for c in cart_ids if str(c).isdigit()]
+    if not cart_ids:
+        return None
+
+    carts = Carts.query.filter(Carts.cart_user_id == user_id,
+                               Carts.cart_id.in_(cart_ids)).order_by(Carts.cart_id).all()
+    if not carts:
+        return None
+
+    try:
+        # payable and total are worked out server side from the current price and quantity,
+        # the same way the cart and checkout pages show them
+        prices = dict(db.session.execute(
+            select(Product.prod_id, Product.amount)
+            .where(Product.prod_id.in_({cart.cart_prod_id for cart in carts}))).all())
+        total = Decimal('0.00')
+        history_rows = []
+        for cart in carts:
+            price = Decimal(str(prices.get(cart.cart_prod_id) or 0)).quantize(Decimal('0.00'))
+            cart.cart_amt = price
+            payable = (price * (cart.cart_qty or 0)).quantize(Decimal('0.00'))
+            cart.cart_payable = payable
+            total += payable
+            history_rows.append({'prod_id': cart.cart_prod_id, 'user_id': user_id, 'price': price,
+                                 'quantity': cart.cart_qty or 0, 'amt_payable': payable,
+                                 'total': Decimal('0.00')})
+
+        # the order total is shown once, against the last line of the purchase
+        history_rows[-1]['total'] = total
+
+        order = Orders(order_status='0', order_userid=user_id, order_total=total)
+        db.session.add(order)
+        db.session.flush()
+        for row in history_rows:
+            row['order_id'] = order.order_id
+
+        db.session.execute(insert(History), history_rows)
+
+        db.session.execute(insert(OrderDetails),
+                           [{'details_prod_id': cart.cart_prod_id, 'details_orderid': order.order_id}
+                            for cart in carts])
+
+        ref = int(random.random() * 10000000000000)
+        pay = Payment(pay_user=user_id, pay_order=order.order_id, pay_amt=total, pay_ref=ref)
+        db.session.add(pay)
+        db.session.flush()
+
+        reserve(user_id, order.order_id, [(cart.cart_prod_id, cart.cart_qty) for cart in carts])
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return ref
+# ************************************** ORDER PLACEMENT **************************************
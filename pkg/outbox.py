@@ -0,0 +1,127 @@
+import json, smtplib, threading
+from datetime import datetime, timedelta
+
+from flask_mail import Message # type: ignore
+from sqlalchemy import select
+
+from pkg.models import db, OutboxMessage
+
+
+# ************************************** MAIL OUTBOX **************************************
+# Requests never talk to SMTP. queue_mail only adds an OutboxMessage to the current session,
+# so an email is committed (or rolled back) together with the signup or payment behind it.
+# The sender claims due messages in batches, sends a whole batch over one SMTP connection
+# and reschedules failures with exponential backoff until MAIL_OUTBOX_MAX_ATTEMPTS.
+
+def queue_mail(recipients, subject, body=None, html=None):
+    """Add an email to the outbox; it goes out once the caller's transaction commits."""
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    message = OutboxMessage(recipients=json.dumps(list(recipients)), subject=subject, body=body, html=html)
+    db.session.add(message)
+    return message
+
+
+def claim_messages(limit):
+    """Lock up to `limit` due messages; concurrent senders skip rows another sender holds."""
+    query = (select(OutboxMessage)
+             .where(OutboxMessage.status == 'queued', OutboxMessage.run_after <= datetime.utcnow())
+             .order_by(OutboxMessage.run_after)
+             .limit(limit))
+    if db.engine.dialect.name in ('postgresql', 'mysql'):
+        query = query.with_for_update(skip_locked=True)
+    return db.session.execute(query).scalars().all()
+
+
+class MailSender(object):
+    """Background worker draining the mail_outbox table through Flask-Mail.
+
+    Run it as its own process with `flask send-mail`, or inside the web process by setting
+    MAIL_OUTBOX_INPROCESS. Any SMTP server will do, including scripts/debug_smtp.py locally.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['MAIL_OUTBOX_BATCH']
+        self.poll_interval = app.config['MAIL_OUTBOX_POLL']
+        self.max_attempts = app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+        self.backoff = app.config['MAIL_OUTBOX_BACKOFF']
+        app.extensions['mail_sender'] = self
+
+    def _retry(self, message, error):
+        message.attempts += 1
+        message.last_error = str(error)[:2000]
+        if message.attempts >= self.max_attempts:
+            message.status = 'failed'
+            self.app.logger.error("Giving up on email %s to %s: %s", message.msg_id, message.recipients, error)
+        else:
+            message.run_after = datetime.utcnow() + timedelta(seconds=self.backoff * 2 ** (message.attempts - 1))
+
+    def run_once(self):
+        """Claim and send one batch. Returns the number of messages handled."""
+        from pkg import mail
+
+        messages = claim_messages(self.batch_size)
+        if not messages:
+            db.session.commit()
+            return 0
+
+        pending = list(messages)
+        try:
+            with mail.connect() as conn:
+                while pending:
+                    message = pending[0]
+                    try:
+                        conn.send(Message(message.subject, recipients=json.loads(message.recipients),
+                                          body=message.body, html=message.html))
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except smtplib.SMTPException as e:
+                        # refused by the server (bad recipient, rejected content); the connection is fine
+                        self._retry(message, e)
+                    else:
+                        message.status = 'sent'
+                        message.sent_at = datetime.utcnow()
+                    pending.pop(0)
+        except (smtplib.SMTPException, OSError) as e:
+            # could not connect or lost the connection: whatever was not sent waits for a retry
+            self.app.logger.warning("SMTP unavailable, %s email(s) rescheduled: %s", len(pending), e)
+            for message in pending:
+                self._retry(message, e)
+
+        db.session.commit()
+        return len(messages)
+
+    def run_forever(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    handled = self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error("Sending mail failed: %s", e, exc_info=True)
+                    handled = 0
+                finally:
+                    db.session.remove()
+                # keep draining while there is a backlog, otherwise wait for new mail
+                if handled < self.batch_size:
+                    self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='mail-sender', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+# ************************************** MAIL OUTBOX **************************************
@@ -0,0 +1,126 @@
+import os, threading, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from pkg.models import db
+
+
+class HashingBusy(Exception):
+    """Raised when too many hash requests are already waiting for the pool, or one timed out."""
+
+
+BUSY_MESSAGE = 'The server is busy right now, please try again in a moment'
+
+
+# ************************************** PASSWORD HASHING **************************************
+def rehash_password(account, field, password):
+    """Re-hash account.<field> with the current cost settings if it was made with older ones."""
+    from pkg import hasher
+
+    if hasher.needs_rehash(getattr(account, field)):
+        try:
+            setattr(account, field, hasher.hash(password))
+            db.session.commit()
+        except HashingBusy:
+            # the login already succeeded; try again on the next one
+            db.session.rollback()
+
+
+class PasswordHasher(object):
+    """Runs password KDF calls in a bounded process pool, off the request thread's GIL.
+
+    At most PASSWORD_HASH_MAX_PENDING calls may be queued or running per web process; beyond
+    that HashingBusy is raised so a login burst sheds load instead of piling up requests.
+    With PASSWORD_HASH_WORKERS = 0 hashes run inline, which is what tests and the dev server want.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.timeout = 10
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(32)
+        self._prefix = None
+        self._latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+        self._prefix = None
+        app.extensions['password_hasher'] = self
+
+    @property
+    def pool(self):
+        # created on first use in each process, so forked gunicorn workers get their own
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy(BUSY_MESSAGE)
+
+        started = time.perf_counter()
+        try:
+            if self.workers:
+                future = self.pool.submit(fn, *args)
+                try:
+                    return future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    # still queued behind a burst: drop it; already running: let it finish unread
+                    future.cancel()
+                    self.rejected += 1
+                    raise HashingBusy(BUSY_MESSAGE)
+            return fn(*args)
+        finally:
+            self._slots.release()
+            self._latencies.append(time.perf_counter() - started)
+            self.calls += 1
+
+    def close(self, wait=True):
+        # only the process that created the pool may shut it down
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=wait)
+        self._pool = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    @property
+    def current_prefix(self):
+        # werkzeug fills in default parameters ('scrypt' -> 'scrypt:32768:8:1'), so learn the
+        # full prefix from one real hash instead of parsing the configured method
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.current_prefix
+
+    def stats(self):
+        samples = sorted(self._latencies)
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2) if samples else 0.0
+
+        return {'method': self.current_prefix, 'workers': self.workers, 'calls': self.calls,
+                'rejected': self.rejected, 'p50_ms': pct(0.50), 'p95_ms': pct(0.95),
+                'max_ms': round(samples[-1] * 1000, 2) if samples else 0.0}
+# ************************************** PASSWORD HASHING **************************************
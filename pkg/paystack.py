@@ -0,0 +1,197 @@
+import asyncio, os, random, threading, time
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+
+class PaystackError(Exception):
+    """Raised when Paystack cannot be reached or rejects the request."""
+
+
+def to_kobo(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1')))
+
+
+def _backoff(attempt, base, cap):
+    # "full jitter": sleep a random time up to the exponential ceiling
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _never_sent(error):
+    # requests reports a reset mid-response as a ConnectionError too; only a failure to open
+    # the connection proves the request never reached Paystack
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _record(path, outcome, seconds):
+    # '/transaction/verify/<ref>' -> 'verify'
+    from pkg import metrics
+
+    parts = path.strip('/').split('/')
+    metrics.observe_gateway('paystack', parts[1] if len(parts) > 1 else parts[0], outcome, seconds)
+
+
+# ************************************** SYNC CLIENT **************************************
+class PaystackClient(object):
+    """Pooled, keep-alive Paystack client with connect/read timeouts and jittered retries.
+
+    The session is created lazily per process so a gunicorn master that preloads the app
+    never hands its sockets to the forked workers.
+    """
+
+    def __init__(self, app=None):
+        self.base_url = 'https://api.paystack.co'
+        self.secret_key = None
+        self.timeout = (3.05, 10)
+        self.max_retries = 2
+        self.backoff = 0.25
+        self.backoff_cap = 2.0
+        self.pool_size = 10
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.base_url = app.config['PAYSTACK_BASE_URL'].rstrip('/')
+        self.secret_key = app.config['PAYSTACK_SECRET_KEY']
+        self.timeout = (app.config['PAYSTACK_CONNECT_TIMEOUT'], app.config['PAYSTACK_READ_TIMEOUT'])
+        self.max_retries = app.config['PAYSTACK_MAX_RETRIES']
+        self.backoff = app.config['PAYSTACK_RETRY_BACKOFF']
+        self.pool_size = app.config['PAYSTACK_POOL_SIZE']
+        app.extensions['paystack'] = self
+
+    @property
+    def headers(self):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {self.secret_key}"}
+
+    @property
+    def session(self):
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _request(self, method, path, idempotent=True, **kwargs):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = self._send(method, path, idempotent, **kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            _record(path, outcome, time.perf_counter() - started)
+
+    def _send(self, method, path, idempotent, **kwargs):
+        # a read timeout or a 5xx/429 on a non-idempotent call may mean Paystack already acted
+        # on it, so only failures to connect are retried there
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    return response.json()
+                if not idempotent or attempt == self.max_retries:
+                    # an outage, not an answer about the transaction; callers retry later
+                    raise PaystackError(f'Paystack answered HTTP {response.status_code}')
+            except requests.ConnectionError as e:
+                if (not idempotent and not _never_sent(e)) or attempt == self.max_retries:
+                    raise PaystackError(f'Paystack is unreachable: {e}') from e
+            except requests.Timeout as e:
+                if not idempotent or attempt == self.max_retries:
+                    raise PaystackError(f'Paystack timed out: {e}') from e
+            except ValueError as e:
+                raise PaystackError('Paystack returned an invalid response') from e
+            time.sleep(_backoff(attempt, self.backoff, self.backoff_cap))
+
+    def initialize(self, reference, amount, email, callback_url):
+        data = {"reference": reference, "amount": to_kobo(amount), "email": email,
+                "callback_url": callback_url}
+        return self._request('POST', '/transaction/initialize', idempotent=False, json=data)
+
+    def verify(self, reference):
+        return self._request('GET', f'/transaction/verify/{reference}')
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+# ************************************** SYNC CLIENT **************************************
+
+
+# ************************************** ASYNC CLIENT **************************************
+class AsyncPaystackClient(object):
+    """asyncio flavour of PaystackClient for async views; needs the optional httpx package."""
+
+    def __init__(self, client):
+        try:
+            import httpx # type: ignore
+        except ImportError:
+            raise RuntimeError('AsyncPaystackClient needs httpx: pip install httpx')
+
+        self.sync = client
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(
+            base_url=client.base_url,
+            headers=client.headers,
+            timeout=httpx.Timeout(client.timeout[1], connect=client.timeout[0]),
+            limits=httpx.Limits(max_connections=client.pool_size,
+                                max_keepalive_connections=client.pool_size),
+        )
+
+    async def _request(self, method, path, idempotent=True, **kwargs):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await self._send(method, path, idempotent, **kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            _record(path, outcome, time.perf_counter() - started)
+
+    async def _send(self, method, path, idempotent, **kwargs):
+        client = self.sync
+        for attempt in range(client.max_retries + 1):
+            try:
+                response = await self._client.request(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    return response.json()
+                if not idempotent or attempt == client.max_retries:
+                    raise PaystackError(f'Paystack answered HTTP {response.status_code}')
+            except (self._httpx.ConnectError, self._httpx.ConnectTimeout) as e:
+                if attempt == client.max_retries:
+                    raise PaystackError(f'Paystack is unreachable: {e}') from e
+            except self._httpx.TransportError as e:
+                if not idempotent or attempt == client.max_retries:
+                    raise PaystackError(f'Paystack request failed: {e}') from e
+            except ValueError as e:
+                raise PaystackError('Paystack returned an invalid response') from e
+            await asyncio.sleep(_backoff(attempt, client.backoff, client.backoff_cap))
+
+    async def initialize(self, reference, amount, email, callback_url):
+        data = {"reference": reference, "amount": to_kobo(amount), "email": email,
+                "callback_url": callback_url}
+        return await self._request('POST', '/transaction/initialize', idempotent=False, json=data)
+
+    async def verify(self, reference):
+        return await self._request('GET', f'/transaction/verify/{reference}')
+
+    async def aclose(self):
+        await self._client.aclose()
+# ************************************** ASYNC CLIENT **************************************
@@ -0,0 +1,114 @@
+import json, random, re, time
+from collections import defaultdict
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ************************************** QUERY PROFILER **************************************
+# Counts every statement a request sends to any engine (primary or replica), times it and
+# groups statements by shape: the SQL with literals and IN lists collapsed. A SELECT shape
+# repeated QUERY_PROFILER_N1_THRESHOLD times in one request is reported as an N+1, which is
+# what a lazy relationship touched inside a template loop looks like.
+
+IN_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    shape = IN_LIST.sub('(?)', statement)
+    shape = LITERALS.sub('?', shape)
+    return SPACES.sub(' ', shape).strip()
+
+
+class QueryProfiler(object):
+    """Per-request query counts, DB time and N+1 detection.
+
+    QUERY_PROFILER is 'off', 'on' (every request) or 'sampled' (QUERY_PROFILER_SAMPLE_RATE of
+    requests). Results go to X-DB-* response headers (QUERY_PROFILER_HEADERS) and one JSON log
+    line per profiled request, logged as a warning when an N+1 or a slow request is found.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = 'off'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config['QUERY_PROFILER']
+        self.sample_rate = app.config['QUERY_PROFILER_SAMPLE_RATE']
+        self.n1_threshold = app.config['QUERY_PROFILER_N1_THRESHOLD']
+        self.slow_ms = app.config['QUERY_PROFILER_SLOW_MS']
+        self.headers = app.config['QUERY_PROFILER_HEADERS']
+        app.extensions['query_profiler'] = self
+        if self.mode == 'off':
+            return
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _start(self):
+        if self.mode == 'on' or random.random() < self.sample_rate:
+            g._query_profile = {'queries': 0, 'db_time': 0.0, 'started': time.perf_counter(),
+                                'shapes': defaultdict(lambda: [0, 0.0])}
+
+    def report(self, profile):
+        repeated = sorted(((count, seconds, shape) for shape, (count, seconds) in profile['shapes'].items()
+                           if count > 1), reverse=True)
+        n_plus_one = [{'count': count, 'ms': round(seconds * 1000, 2), 'sql': shape[:300]}
+                      for count, seconds, shape in repeated
+                      if count >= self.n1_threshold and shape.upper().startswith('SELECT')]
+        return {'queries': profile['queries'],
+                'db_ms': round(profile['db_time'] * 1000, 2),
+                'request_ms': round((time.perf_counter() - profile['started']) * 1000, 2),
+                'duplicated_shapes': len(repeated),
+                'n_plus_one': n_plus_one}
+
+    def _finish(self, response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+
+        report = self.report(profile)
+        if self.headers:
+            response.headers['X-DB-Queries'] = str(report['queries'])
+            response.headers['X-DB-Time-ms'] = str(report['db_ms'])
+            response.headers['X-DB-Duplicated'] = str(report['duplicated_shapes'])
+            if report['n_plus_one']:
+                response.headers['X-DB-N-Plus-One'] = str(len(report['n_plus_one']))
+
+        line = json.dumps({'event': 'query_profile', 'method': request.method, 'path': request.path,
+                           'endpoint': request.endpoint, 'status': response.status_code, **report})
+        if report['n_plus_one'] or report['request_ms'] >= self.slow_ms:
+            self.app.logger.warning(line)
+        else:
+            self.app.logger.info(line)
+        return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get('_query_profile') is not None:
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('_query_started')
+    if not started or not has_app_context():
+        return
+    profile = g.get('_query_profile')
+    elapsed = time.perf_counter() - started.pop()
+    if profile is None:
+        return
+    profile['queries'] += 1
+    profile['db_time'] += elapsed
+    entry = profile['shapes'][statement_shape(statement)]
+    entry[0] += 1
+    entry[1] += elapsed
+# ************************************** QUERY PROFILER **************************************
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from pkg.models import db, Category, Image, Product
+
+
+# ************************************** CATALOG READ MODELS **************************************
+# Pages that only display products (storefront, search, the admin product tables) read plain
+# columns with select() and get ProductView objects back: no identity map, no change tracking,
+# no lazy relationships. Each row carries its category name and its images, aggregated into one
+# JSON array by a correlated subquery on ix_images_product_id, so a page is a single statement.
+# Anything that changes a product still loads the Product entity.
+
+ImageView = namedtuple('ImageView', 'img_id filename variants')
+CategoryView = namedtuple('CategoryView', 'cat_id cat_name')
+
+
+class ProductView(object):
+    """A read-only product row with the attributes the templates use."""
+
+    __slots__ = ('prod_id', 'prod_name', 'amount', 'status', 'quantity', 'cat_id', 'dateadded',
+                 'category', 'images')
+
+    def __init__(self, row):
+        self.prod_id = row.prod_id
+        self.prod_name = row.prod_name
+        self.amount = row.amount
+        self.status = row.status
+        self.quantity = row.quantity
+        self.cat_id = row.cat_id
+        self.dateadded = row.dateadded
+        self.category = CategoryView(row.cat_id, row.cat_name) if row.cat_id is not None else None
+        # img_id order is upload order; not every backend can order inside the aggregate
+        self.images = tuple(sorted((ImageView(i['img_id'], i['filename'], i['variants'])
+                                    for i in row.images or ()), key=lambda i: i.img_id))
+
+    def __repr__(self):
+        return f'<ProductView {self.prod_id} {self.prod_name!r}>'
+
+
+def _images_column():
+    dialect = db.engine.dialect.name
+    fields = ('img_id', Image.img_id, 'filename', Image.filename, 'variants', Image.variants)
+    if dialect == 'postgresql':
+        images = func.json_agg(func.json_build_object(*fields), type_=db.JSON)
+    elif dialect == 'mysql':
+        images = func.json_arrayagg(func.json_object(*fields), type_=db.JSON)
+    else:
+        images = func.json_group_array(func.json_object(*fields), type_=db.JSON)
+    return select(images).where(Image.product_id == Product.prod_id).scalar_subquery().label('images')
+
+
+def product_rows():
+    """The select() behind every product view; callers add their own filters and order."""
+    return (select(Product.prod_id, Product.prod_name, Product.amount, Product.status, Product.quantity,
+                   Product.cat_id, Product.dateadded, Category.cat_name, _images_column())
+            .select_from(Product)
+            .outerjoin(Category, Category.cat_id == Product.cat_id))
+
+
+def product_views(query=None):
+    """Run a product_rows() query (every product, oldest first, when omitted) into ProductViews."""
+    if query is None:
+        query = product_rows().order_by(Product.prod_id)
+    return [ProductView(row) for row in db.session.execute(query)]
+
+
+def products_by_id(ids):
+    """ProductViews for the given ids, in the order given; unknown ids are skipped."""
+    if not ids:
+        return []
+    found = {p.prod_id: p for p in product_views(product_rows().where(Product.prod_id.in_(ids)))}
+    return [found[i] for i in ids if i in found]
+# ************************************** CATALOG READ MODELS **************************************
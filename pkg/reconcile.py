@@ -0,0 +1,277 @@
+import hashlib, hmac, json, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import render_template
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from pkg.history import record_spend
+from pkg.inventory import commit_orders, release_expired, release_orders
+from pkg.models import db, Carts, History, OrderDetails, Payment, PaymentJob, Product, Users
+from pkg.outbox import queue_mail
+from pkg.sales import record_sales
+from pkg.paystack import PaystackError
+
+
+# ************************************** JOB QUEUE **************************************
+# Payment settlement runs off the request path. The webhook and the browser's return from
+# Paystack only insert a PaymentJob row; the reconciliation worker claims jobs in batches,
+# settles every Payment in the batch with one commit and sweeps payments left 'pending'.
+
+def valid_signature(secret_key, body, signature):
+    expected = hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+def enqueue(kind, pay_ref, payload=None):
+    job = PaymentJob(kind=kind, pay_ref=str(pay_ref),
+                     payload=json.dumps(payload) if payload is not None else None)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def claim_jobs(limit):
+    """Lock up to `limit` due jobs; concurrent workers skip rows another worker holds."""
+    now = datetime.utcnow()
+    query = (select(PaymentJob)
+             .where(PaymentJob.status == 'queued', PaymentJob.run_after <= now)
+             .order_by(PaymentJob.run_after)
+             .limit(limit))
+    if db.engine.dialect.name in ('postgresql', 'mysql'):
+        query = query.with_for_update(skip_locked=True)
+    return db.session.execute(query).scalars().all()
+# ************************************** JOB QUEUE **************************************
+
+
+# ************************************** SETTLEMENT **************************************
+# transaction statuses after which Paystack will not charge the customer for this reference
+FINAL_FAILURES = {'failed', 'abandoned', 'reversed'}
+
+
+def outcome_from_event(payload):
+    """Map a Paystack charge event or verify response to (status, actual_amount).
+
+    status is 'pending' when the answer says nothing final: the transaction is still ongoing,
+    or the response carries no transaction at all (an error body). The payment is left alone
+    and its job asks again later.
+    """
+    payload = payload or {}
+    data = payload.get('data') or {}
+    actual = (data.get('amount') or 0) / 100
+    if data.get('status') == 'success' or data.get('gateway_response') == 'Successful':
+        return 'paid', actual
+    if data.get('status') in FINAL_FAILURES or payload.get('event') == 'charge.failed':
+        return 'failed', actual
+    return 'pending', 0
+
+
+def queue_receipts(paid):
+    """Queue a receipt email for each paid payment, committed with the settlement."""
+    if not paid:
+        return
+    users = {u.user_id: u for u in Users.query.filter(Users.user_id.in_({pay.pay_user for pay in paid}))}
+    lines = defaultdict(list)
+    for line in db.session.execute(
+        select(History.order_id, Product.prod_name, History.quantity, History.price, History.amt_payable)
+        .join(Product, Product.prod_id == History.prod_id)
+        .where(History.order_id.in_([pay.pay_order for pay in paid]))
+        .order_by(History.id)
+    ):
+        lines[line.order_id].append(line)
+
+    for pay in paid:
+        user = users.get(pay.pay_user)
+        if user is not None and user.email:
+            queue_mail(user.email, f'Your iFARM receipt for order #{pay.pay_order}',
+                       render_template('emails/receipt.txt', user=user, pay=pay, lines=lines[pay.pay_order]))
+
+
+def settle(payments, outcomes):
+    """Apply outcomes {pay_ref: (status, actual, payload)} to the loaded payments in one go."""
+    paid, failed, recovered, failed_orders = [], [], [], []
+
+    for pay in sorted(payments, key=lambda p: p.pay_id):
+        status, actual, payload = outcomes[str(pay.pay_ref)]
+        # a settled payment is final; late or repeated events never flip 'paid' back
+        if pay.pay_status == 'paid':
+            continue
+        previous = pay.pay_status
+        # the webhook and a verify job for the same ref can be settled by two workers at once;
+        # the status only moves if nobody moved it since we read it, so exactly one of them
+        # goes on to record the spend, the sales and the receipt
+        moved = db.session.execute(
+            update(Payment)
+            .where(Payment.pay_id == pay.pay_id, Payment.pay_status == previous)
+            .values(pay_status=status, pay_actual=actual, pay_data=json.dumps(payload))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if moved != 1:
+            continue
+        for key, value in (('pay_status', status), ('pay_actual', actual), ('pay_data', json.dumps(payload))):
+            set_committed_value(pay, key, value)
+        if status == 'paid':
+            paid.append(pay)
+            if previous == 'failed':
+                recovered.append(pay)
+        else:
+            failed_orders.append(pay.pay_order)
+            if previous != 'failed':
+                failed.append(pay)
+
+    # a failed order keeps its History lines (purchase history hides them while the payment
+    # stands failed), so a later failed -> paid recovery still has the lines for the product
+    # rollups and the receipt
+    release_orders(failed_orders)
+
+    for pay in paid:
+        bought = select(OrderDetails.details_prod_id).where(OrderDetails.details_orderid == pay.pay_order)
+        db.session.execute(delete(Carts).where(Carts.cart_user_id == pay.pay_user,
+                                               Carts.cart_prod_id.in_(bought)))
+
+    commit_orders([pay.pay_order for pay in paid])
+    record_spend(paid)
+    record_sales(paid, failed, recovered)
+    queue_receipts(paid)
+
+    return len(paid), len(failed_orders)
+
+
+class PaymentReconciler(object):
+    """Background worker draining the payment_jobs table.
+
+    Run it as its own process with `flask reconcile-payments`, or inside the web process by
+    setting PAYMENT_WORKER_INPROCESS (handy for a single-process development server).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['PAYMENT_WORKER_BATCH']
+        self.poll_interval = app.config['PAYMENT_WORKER_POLL']
+        self.sweep_after = timedelta(seconds=app.config['PAYMENT_SWEEP_AFTER'])
+        self.sweep_interval = app.config['PAYMENT_SWEEP_INTERVAL']
+        self.max_attempts = app.config['PAYMENT_JOB_MAX_ATTEMPTS']
+        self.verify_threads = app.config['PAYMENT_VERIFY_THREADS']
+        app.extensions['payment_reconciler'] = self
+
+    def _verify_all(self, refs):
+        from pkg import paystack
+
+        def verify(ref):
+            try:
+                return ref, paystack.verify(ref), None
+            except PaystackError as e:
+                return ref, None, str(e)
+
+        with ThreadPoolExecutor(self.verify_threads) as pool:
+            return list(pool.map(verify, refs))
+
+    def run_once(self):
+        """Claim and settle one batch. Returns the number of jobs handled."""
+        jobs = claim_jobs(self.batch_size)
+        if not jobs:
+            db.session.commit()
+            return 0
+
+        outcomes = {}
+        for job in jobs:
+            if job.kind == 'webhook':
+                payload = json.loads(job.payload or '{}')
+                status, actual = outcome_from_event(payload)
+                if status != 'pending':
+                    outcomes[job.pay_ref] = (status, actual, payload)
+
+        # 'verify' jobs, and webhooks that settle nothing, ask the gateway; the calls for a
+        # batch run concurrently. An outage or a transaction that is not final yet requeues
+        # the job with backoff and leaves the payment pending.
+        to_verify = sorted({j.pay_ref for j in jobs} - set(outcomes))
+        errors = {}
+        for ref, payload, error in self._verify_all(to_verify):
+            if error:
+                errors[ref] = error
+                continue
+            status, actual = outcome_from_event(payload)
+            if status == 'pending':
+                data = payload.get('data') or {}
+                errors[ref] = f"Not final yet: {data.get('status') or payload.get('message') or 'no transaction'}"
+            else:
+                outcomes[ref] = (status, actual, payload)
+
+        payments = Payment.query.filter(Payment.pay_ref.in_(list(outcomes))).all() if outcomes else []
+        settle(payments, outcomes)
+
+        now = datetime.utcnow()
+        for job in jobs:
+            if job.pay_ref in errors:
+                job.attempts += 1
+                job.last_error = errors[job.pay_ref]
+                if job.attempts >= self.max_attempts:
+                    job.status = 'failed'
+                else:
+                    job.run_after = now + timedelta(seconds=2 ** job.attempts * self.poll_interval)
+            else:
+                job.status = 'done'
+
+        db.session.commit()
+        return len(jobs)
+
+    def sweep(self):
+        """Queue a verify job for every payment stuck in 'pending' with no job waiting, and
+        give back the stock of reservations that have expired."""
+        cutoff = datetime.utcnow() - self.sweep_after
+        waiting = select(PaymentJob.pay_ref).where(PaymentJob.status == 'queued')
+        refs = db.session.execute(
+            select(Payment.pay_ref)
+            .where(Payment.pay_status == 'pending', Payment.pay_date < cutoff,
+                   Payment.pay_ref.not_in(waiting))
+            .limit(self.batch_size * 10)
+        ).scalars().all()
+
+        if refs:
+            db.session.add_all([PaymentJob(kind='verify', pay_ref=ref) for ref in refs])
+        released = release_expired(self.batch_size * 10)
+        db.session.commit()
+        if released:
+            self.app.logger.info("Released %s expired stock reservation(s)", released)
+        return len(refs)
+
+    def run_forever(self):
+        last_sweep = 0
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    if time.monotonic() - last_sweep >= self.sweep_interval:
+                        self.sweep()
+                        last_sweep = time.monotonic()
+                    handled = self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error("Payment reconciliation failed: %s", e, exc_info=True)
+                    handled = 0
+                finally:
+                    db.session.remove()
+                # keep draining while there is a backlog, otherwise wait for new work
+                if handled < self.batch_size:
+                    self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='payment-reconciler',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+# ************************************** SETTLEMENT **************************************
@@ -0,0 +1,132 @@
+import random, threading, time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, text
+from sqlalchemy.sql.dml import UpdateBase
+
+
+# ************************************** READ REPLICAS **************************************
+# Replica URLs become SQLALCHEMY_BINDS named replica_0, replica_1, ... RoutingSession sends a
+# plain SELECT to a healthy replica only when every one of these holds:
+#   - it runs inside a GET/HEAD request (POST handlers, the payment worker and CLI commands
+#     always read the primary, so read-then-write logic never sees stale rows);
+#   - nothing has been written by this request's session yet;
+#   - the user has not written in the last REPLICA_STICKY_SECONDS, so a redirect after
+#     "add to cart" reads the primary and shows the new line;
+#   - it is not a SELECT ... FOR UPDATE (raw text() statements always go to the primary).
+# A replica whose measured lag exceeds REPLICA_MAX_LAG is skipped until it catches up; with
+# none healthy, reads fall back to the primary.
+
+STICKY_KEY = '_db_primary_until'
+
+
+def replica_lag(engine):
+    """Seconds the replica is behind its primary (0 for a standalone database)."""
+    with engine.connect() as conn:
+        dialect = engine.dialect.name
+        if dialect == 'postgresql':
+            return float(conn.execute(text(
+                "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)")).scalar())
+        if dialect == 'mysql':
+            row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            if row is None:
+                return 0.0
+            lag = row.get('Seconds_Behind_Source')
+            # NULL means replication is stopped or broken
+            return float('inf') if lag is None else float(lag)
+        return 0.0
+
+
+class ReplicaRouter(object):
+    """Chooses a replica engine for read-only queries, tracking each replica's lag."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.keys = []
+        self._lag = {}
+        self._checking = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.keys = sorted(k for k in (app.config.get('SQLALCHEMY_BINDS') or {})
+                           if k.startswith('replica_'))
+        self.max_lag = app.config['REPLICA_MAX_LAG']
+        self.sticky = app.config['REPLICA_STICKY_SECONDS']
+        self.check_interval = app.config['REPLICA_LAG_CHECK_INTERVAL']
+        self._lag = {}
+        self.reads = {key: 0 for key in self.keys}
+        self.fallbacks = 0
+        app.extensions['replica_router'] = self
+
+    def _refresh(self, engines):
+        # one thread measures; the others keep using the last known lag meanwhile
+        if not self._checking.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            for key in self.keys:
+                lag, checked = self._lag.get(key, (None, 0))
+                if now - checked < self.check_interval:
+                    continue
+                try:
+                    lag = replica_lag(engines[key])
+                except Exception as e:
+                    self.app.logger.warning("Replica %s unavailable: %s", key, e)
+                    lag = float('inf')
+                self._lag[key] = (lag, now)
+        finally:
+            self._checking.release()
+
+    def pick(self, engines):
+        """Return the bind key of a healthy replica, or None to use the primary."""
+        if not self.keys:
+            return None
+        self._refresh(engines)
+        healthy = [k for k in self.keys
+                   if self._lag.get(k, (None, 0))[0] is not None and self._lag[k][0] <= self.max_lag]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        key = random.choice(healthy)
+        self.reads[key] += 1
+        return key
+
+    def mark_write(self):
+        if self.keys and self.sticky and has_request_context():
+            session[STICKY_KEY] = time.time() + self.sticky
+
+    def reads_allowed(self):
+        if not has_request_context() or request.method not in ('GET', 'HEAD'):
+            return False
+        return session.get(STICKY_KEY, 0) < time.time()
+
+    def stats(self):
+        def lag(key):
+            seconds = self._lag.get(key, (None, 0))[0]
+            return 'unavailable' if seconds == float('inf') else seconds
+
+        return {'replicas': {k: {'lag': lag(k), 'reads': self.reads[k]} for k in self.keys},
+                'max_lag': self.max_lag, 'fallbacks': self.fallbacks}
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that reads from a replica when it is safe to (see above)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        router = current_app.extensions.get('replica_router')
+        if bind is None and router is not None and router.keys:
+            if self._flushing or isinstance(clause, UpdateBase):
+                if not self.info.get('wrote'):
+                    self.info['wrote'] = True
+                    router.mark_write()
+            elif (isinstance(clause, Select) and clause._for_update_arg is None
+                  and not self.info.get('wrote') and router.reads_allowed()):
+                key = router.pick(self._db.engines)
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+# ************************************** READ REPLICAS **************************************
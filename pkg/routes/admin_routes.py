@@ -1,10 +1,15 @@
 import secrets,os, requests, random , json# type: ignore
 from functools import wraps
-from flask import render_template,request,flash,redirect,url_for,session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import render_template,request,flash,redirect,url_for,session,jsonify
 from flask_mail import Message # type: ignore
 
-from pkg import app, mail
+from pkg import app, mail, fragment_cache, hasher, image_pipeline, pool_metrics, replica_router, product_search, catalog_snapshot
+from pkg.catalog import category_list
+from pkg.readmodels import product_views
+from pkg.sales import sales_dashboard
+from pkg.inventory import short_orders
+from pkg.accounts import find_account, email_taken, classify_identifier, normalize_phone
+from pkg.passwords import HashingBusy, rehash_password
 from pkg.models import db, Admin,Category,Image,Product, Carts,OrderDetails, Payment, Orders
 from pkg.forms import AdminSignUpForm,AdminLoginForm, AddProductForm, SettingsForm, UpdateProductForm # type: ignore
 
@@ -26,13 +31,12 @@ def admin_signup():
     if request.method == 'POST' and form.validate_on_submit():
 
         username = form.username.data
-        email = form.username.data
-        phone = form.username.data
+        email = form.email.data
+        phone = form.phone.data
         password = form.password.data
         cpassword = form.cpassword.data
 
-        existing_admin = Admin.query.filter_by(email=email).first()
-        if existing_admin:
+        if email_taken(Admin, email):
             flash('Admin with this email already exists',category='danger')
             return redirect(url_for('admin_signup'))
         
@@ -40,8 +44,12 @@ def admin_signup():
             flash('Passwords do not match!','danger')
             return redirect(url_for('admin_signup'))
         
-        hashed_password = generate_password_hash(password)
-        new_admin = Admin(email=email, password=hashed_password,phone=phone,username=username)
+        try:
+            hashed_password = hasher.hash(password)
+        except HashingBusy as hb:
+            flash(str(hb),'warning')
+            return redirect(url_for('admin_signup'))
+        new_admin = Admin(email=email, password=hashed_password,phone=normalize_phone(phone),username=username)
         db.session.add(new_admin)
         db.session.commit()
         flash('Admin account created successfully. Please log in.','success')
@@ -56,27 +64,25 @@ def admin_login():
         username = form.username.data
         password = form.password.data
 
-        if username.isdigit():
-            if len(username) != 11:
+        try:
+            admin = find_account(Admin, username)
+            kind, value = classify_identifier(username)
+            if admin is None and kind == 'phone' and len(value) != 11:
                 flash('Invalid! Phone number must be 11 digits','danger')
-            else:
-                admin = Admin.query.filter((Admin.email == username) | (Admin.username == username) | (Admin.phone == username)).first()
-                if admin and check_password_hash(admin.password,password) and admin.is_admin:
-                    session['admin'] = admin.id
-                    flash('Admin login successful','success')
-                    return redirect(url_for('admin_home'))
-                else:
-                    flash('Invalid credentials or not an admin','danger')
-                    return redirect(url_for('admin_login'))
-        else:
-            admin = Admin.query.filter((Admin.email == username) | (Admin.username == username) | (Admin.phone == username)).first()
-            if admin and check_password_hash(admin.password,password):
+                return redirect(url_for('admin_login'))
+
+            if admin and hasher.verify(admin.password,password):
+                rehash_password(admin, 'password', password)
                 session['adminonline'] = admin.admin_id
                 flash('Admin login successful','success')
                 return redirect(url_for('admin_home'))
             else:
                 flash('Invalid credentials! You are not an admin','danger')
                 return redirect(url_for('admin_login'))
+        except HashingBusy as hb:
+            flash(str(hb),'warning')
+            return redirect(url_for('admin_login'))
+
     return render_template('admin/admin_login.html', form=form)
 
 @app.route('/admin/logout/')
@@ -90,22 +96,22 @@ def admin_logout():
 @login_required
 def admin_home():
     form=AddProductForm()
-    category = Category.query.all()
+    category = category_list()
     return render_template('admin/admin.html',form=form, category=category)
 
 @app.route('/admin/addproduct/',methods=['GET','POST'])
 @login_required
 def add_product():
     form=AddProductForm()
-    category = Category.query.all()
-    products = Product.query.all()
+    category = category_list()
+    products = product_views()
 
     if request.method == 'POST':
         if form.validate_on_submit():
             try:
                 prod_name = form.name.data.capitalize()
                 price = form.price.data
-                category = request.form.get('category')
+                cat_id = request.form.get('category', type=int)
                 quantity = form.quantity.data
                 pics = form.image.data
                 status = form.status.data
@@ -115,30 +121,26 @@ def add_product():
                 if check_product:
                     raise ValueError('Product has been registered before, do you wish to make an update? If so, use the update button')
 
-                product = Product(prod_name=prod_name,amount=price,status=status,category=category,quantity=quantity)
+                if pics:
+                    image_pipeline.validate(pics)
+
+                product = Product(prod_name=prod_name,amount=price,status=status,cat_id=cat_id,quantity=quantity)
 
                 db.session.add(product)
                 db.session.commit()
 
                 if pics:
-                    if len(pics)>4:
-                        raise ValueError('Maximum number file is 4')
-
-                    allowed_format = ['.jpg','.png','.jpeg']
-                    for pic in pics:
-                        pics_name = pic.filename
-                        _,ext = os.path.splitext(pics_name)
-                        if ext.lower() not in allowed_format:
-                            raise ValueError(f'Image format not supported! {pic.filename}')
-                        
-                        newname = secrets.token_hex(10) + ext
-                        pic.save('pkg/static/products/'+newname)
-                        
-                        img = Image(filename=newname,product_id=product.prod_id)
-
-                        db.session.add(img)
+                    images = [Image(filename=image_pipeline.save(pic),product_id=product.prod_id) for pic in pics]
+                    db.session.add_all(images)
                     db.session.commit()
 
+                    # resized variants are built in the background; the page returns now
+                    for img in images:
+                        image_pipeline.submit(img)
+
+                fragment_cache.invalidate(product.prod_id)
+                product_search.index_product(product)
+                catalog_snapshot.refresh([product.prod_id])
                 flash('Product added successfully!','success')
                 return redirect(url_for('add_product'))
             
@@ -165,9 +167,14 @@ def delete_product():
 
     product = Product.query.get(id)
     # product = Product.query.filter_by(product_id=id)
+    images = list(product.images)
 
     db.session.delete(product)
     db.session.commit()
+    fragment_cache.invalidate(product.prod_id)
+    product_search.remove_product(product.prod_id)
+    catalog_snapshot.refresh([product.prod_id])
+    image_pipeline.release(images)
 
     flash('Product deleted successfully','success')
     return redirect(url_for("admin_home"))
@@ -179,69 +186,114 @@ def delete_product():
 def update_product():
 
     form=UpdateProductForm()
-    category = Category.query.all()
-    products = Product.query.all()
+    category = category_list()
+    products = product_views()
 
     if request.method == 'POST':
 
         if form.validate_on_submit():
             try:
-                id = request.form.get('id')
+                id = request.form.get('id', type=int)
                 price = form.price.data
-                cat = request.form.get('category')
+                cat = request.form.get('category', type=int)
                 quantity = form.quantity.data
                 # pics = form.image.data
                 pics = [pic for pic in form.image.data if pic and pic.filename]
                 status = form.status.data
 
-                product = Product.query.get(id)
-
-                if product:
-                    if price:product.amount = price
-
-                    if cat:product.category = cat
-                        
-                    if quantity:product.quantity = quantity
-                    
-                    if status:product.status = status
+                product = db.session.get(Product, id) if id else None
 
-                    db.session.commit()
+                if not product:
+                    flash('Product not found!','danger')
+                    return redirect(url_for('update_product'))
 
                 if pics:
+                    image_pipeline.validate(pics)
 
-                    if len(pics)>4:
-                        raise ValueError('Maximum number file is 4')
-                    
-                    allowed_format = ['.jpg','.png','.jpeg']
+                if price:product.amount = price
 
-                    Image.query.filter_by(product_id=id).delete()
-                    db.session.commit()
+                if cat:product.cat_id = cat
 
-                    for pic in pics:
-                        
-                        pics_name = pic.filename
-                        _,ext = os.path.splitext(pics_name)
+                if quantity:product.quantity = quantity
 
-                        if ext.lower() not in allowed_format:
-                            raise ValueError(f'Image format not supported! {pic.filename}')
-                        
-                        newname = secrets.token_hex(10) + ext
-                        pic.save('pkg/static/products/'+newname)
+                if status:product.status = status
+
+                db.session.commit()
 
-                        img = Image(filename=newname,product_id=id)
-                        db.session.add(img)
+                if pics:
+                    old_images = Image.query.filter_by(product_id=product.prod_id).all()
+                    for img in old_images:
+                        db.session.delete(img)
+                    images = [Image(filename=image_pipeline.save(pic),product_id=product.prod_id) for pic in pics]
+                    db.session.add_all(images)
                     db.session.commit()
+                    image_pipeline.release(old_images)
+
+                    for img in images:
+                        image_pipeline.submit(img)
 
-                    flash('Product updated successfully!','success')
+                fragment_cache.invalidate(product.prod_id)
+                product_search.index_product(product)
+                catalog_snapshot.refresh([product.prod_id])
+
+                flash('Product updated successfully!','success')
                 return redirect(url_for('add_product'))
             except ValueError as ve:
+                db.session.rollback()
                 flash(str(ve),'danger')
             except Exception as e:
-                flash(str(e), 'danger')
+                db.session.rollback()
+                flash('Product could not be updated, please try again','danger')
+                app.logger.error("An error occurred: %s", e, exc_info=True)
     return render_template('admin/updateproducts.html',form=form,
                                                     category=category, 
                                                     products=products)
 # ************************************** UPDATE PRODUCT**************************************************
 
 
-    
\ No newline at end of file
+
+
+# ************************************** SALES DASHBOARD**************************************************
+def _dashboard_days():
+    return min(max(request.args.get('days', 30, type=int), 1), 366)
+
+@app.route('/admin/sales/')
+@login_required
+def sales():
+    days = _dashboard_days()
+    return render_template('admin/sales.html', report=sales_dashboard(days), days=days, short=short_orders())
+
+@app.route('/admin/sales/json/')
+@login_required
+def sales_json():
+    report = sales_dashboard(_dashboard_days())
+    return jsonify({'start': report['start'].isoformat(), 'end': report['end'].isoformat(),
+                    'totals': {**report['totals'], 'revenue': str(report['totals']['revenue'])},
+                    'daily': [{**d, 'day': d['day'].isoformat(), 'revenue': str(d['revenue'])} for d in report['daily']],
+                    'products': [{'id': p.prod_id, 'name': p.prod_name, 'units': p.units, 'revenue': str(p.revenue)}
+                                 for p in report['products']],
+                    'short_orders': [{'order_id': r.order_id, 'product': r.prod_name, 'quantity': r.quantity}
+                                     for r in short_orders()]})
+# ************************************** SALES DASHBOARD**************************************************
+
+# ************************************** CACHE STATS**************************************************
+@app.route('/admin/cache/stats/')
+@login_required
+def cache_stats():
+    return jsonify(fragment_cache.stats())
+# ************************************** CACHE STATS**************************************************
+
+# ************************************** HASHING STATS**************************************************
+@app.route('/admin/hashing/stats/')
+@login_required
+def hashing_stats():
+    return jsonify(hasher.stats())
+# ************************************** HASHING STATS**************************************************
+
+
+# ************************************** DB POOL STATS**************************************************
+@app.route('/admin/db/stats/')
+@login_required
+def db_pool_stats():
+    return jsonify({**pool_metrics.stats(), **replica_router.stats()})
+# ************************************** DB POOL STATS**************************************************
@@ -0,0 +1,102 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import desc, func, select
+
+from pkg.history import upsert_totals
+from pkg.models import db, History, Payment, Product, ProductSalesDaily, SalesDaily
+
+
+# ************************************** SALES ROLLUPS **************************************
+# sales_daily keeps one row per day (revenue, units, paid and failed payments) and
+# product_sales_daily one row per product per day. Settlement adds each payment that has just
+# become paid or failed with an upsert, so the dashboard reads the rows of the days it shows
+# and never scans orders, payments or history. A payment counts on its own date.
+
+def _day(pay):
+    return (pay.pay_date or datetime.utcnow()).date()
+
+
+def record_sales(paid, failed, recovered=()):
+    """Add newly settled payments to the rollups (no commit).
+
+    paid and failed hold payments that have just moved to that status; recovered holds the
+    paid ones that had failed before, whose failure comes back off the count.
+    """
+    daily = defaultdict(lambda: {'revenue': Decimal('0.00'), 'units': 0, 'paid': 0, 'failed': 0})
+    for pay in paid:
+        daily[_day(pay)]['revenue'] += Decimal(str(pay.pay_actual or pay.pay_amt or 0))
+        daily[_day(pay)]['paid'] += 1
+    for pay in failed:
+        daily[_day(pay)]['failed'] += 1
+    for pay in recovered:
+        daily[_day(pay)]['failed'] -= 1
+
+    products = defaultdict(lambda: [0, Decimal('0.00')])
+    order_days = {pay.pay_order: _day(pay) for pay in paid}
+    orders = list(order_days)
+    for start in range(0, len(orders), 500):
+        lines = db.session.execute(
+            select(History.order_id, History.prod_id, func.sum(History.quantity).label('units'),
+                   func.sum(History.amt_payable).label('revenue'))
+            .where(History.order_id.in_(orders[start:start + 500]))
+            .group_by(History.order_id, History.prod_id)
+        )
+        for line in lines:
+            day = order_days[line.order_id]
+            products[(day, line.prod_id)][0] += line.units or 0
+            products[(day, line.prod_id)][1] += Decimal(str(line.revenue or 0))
+            daily[day]['units'] += line.units or 0
+
+    upsert_totals(SalesDaily, ['day'], [{'day': day, **totals} for day, totals in daily.items()])
+    upsert_totals(ProductSalesDaily, ['day', 'prod_id'],
+                  [{'day': day, 'prod_id': prod_id, 'units': units, 'revenue': revenue}
+                   for (day, prod_id), (units, revenue) in products.items()])
+
+
+def rebuild_sales():
+    """Recompute both rollups from settled payments, e.g. to backfill after deploying them."""
+    db.session.query(ProductSalesDaily).delete()
+    db.session.query(SalesDaily).delete()
+    payments = db.session.execute(
+        select(Payment.pay_order, Payment.pay_date, Payment.pay_status, Payment.pay_actual, Payment.pay_amt)
+        .where(Payment.pay_status.in_(['paid', 'failed']))
+    ).all()
+    record_sales([p for p in payments if p.pay_status == 'paid'],
+                 [p for p in payments if p.pay_status == 'failed'])
+    db.session.commit()
+    return len(payments)
+
+
+def sales_dashboard(days=30, top=10):
+    """Daily totals for the last `days` days (oldest first, gaps filled) and the top products."""
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+
+    stored = {row.day: row for row in SalesDaily.query.filter(SalesDaily.day >= start)}
+    zero = {'revenue': Decimal('0.00'), 'units': 0, 'paid': 0, 'failed': 0}
+    daily = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = stored.get(day)
+        daily.append({'day': day, **({c: getattr(row, c) for c in zero} if row else zero)})
+
+    revenue = func.sum(ProductSalesDaily.revenue).label('revenue')
+    products = db.session.execute(
+        select(ProductSalesDaily.prod_id, Product.prod_name,
+               func.sum(ProductSalesDaily.units).label('units'), revenue)
+        .join(Product, Product.prod_id == ProductSalesDaily.prod_id)
+        .where(ProductSalesDaily.day >= start)
+        .group_by(ProductSalesDaily.prod_id, Product.prod_name)
+        .order_by(desc(revenue))
+        .limit(top)
+    ).all()
+
+    paid = sum(d['paid'] for d in daily)
+    failed = sum(d['failed'] for d in daily)
+    totals = {'revenue': sum((Decimal(d['revenue']) for d in daily), Decimal('0.00')),
+              'units': sum(d['units'] for d in daily), 'paid': paid, 'failed': failed,
+              'success_rate': round(100 * paid / (paid + failed), 1) if paid + failed else None}
+    return {'start': start, 'end': end, 'daily': daily, 'products': products, 'totals': totals}
+# ************************************** SALES ROLLUPS **************************************
@@ -0,0 +1,238 @@
+import bisect, heapq, re, threading, time
+from collections import defaultdict
+
+from sqlalchemy import and_, desc, func, or_, select
+
+from pkg.catalog import category_list
+from pkg.models import db, Product
+from pkg.readmodels import products_by_id
+from pkg.snapshot import current_snapshot
+
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [t.lower() for t in TOKEN.findall(text or '')]
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ************************************** IN-PROCESS INDEX **************************************
+# Used where the database has no text search (SQLite, MySQL). Every word of a product's name
+# and category is a term with a posting set of product ids. Prefixes are found by bisecting
+# the sorted vocabulary and typos through a trigram index over the vocabulary, so a query
+# never looks at products that share none of its terms.
+
+class InvertedIndex(object):
+
+    def __init__(self):
+        self.postings = defaultdict(set)     # term -> product ids
+        self.vocabulary = []                 # sorted terms, for prefix ranges
+        self.grams = defaultdict(set)        # trigram -> terms, for fuzzy matches
+        self.docs = {}                       # product id -> its terms
+        self.lock = threading.RLock()
+
+    def _add_term(self, term):
+        bisect.insort(self.vocabulary, term)
+        for gram in trigrams(term):
+            self.grams[gram].add(term)
+
+    def _drop_term(self, term):
+        i = bisect.bisect_left(self.vocabulary, term)
+        if i < len(self.vocabulary) and self.vocabulary[i] == term:
+            del self.vocabulary[i]
+        for gram in trigrams(term):
+            self.grams[gram].discard(term)
+        del self.postings[term]
+
+    def add(self, prod_id, text):
+        terms = set(tokenize(text))
+        with self.lock:
+            self.remove(prod_id)
+            self.docs[prod_id] = terms
+            for term in terms:
+                if term not in self.postings:
+                    self._add_term(term)
+                self.postings[term].add(prod_id)
+
+    def remove(self, prod_id):
+        with self.lock:
+            for term in self.docs.pop(prod_id, ()):
+                ids = self.postings.get(term)
+                if ids is not None:
+                    ids.discard(prod_id)
+                    if not ids:
+                        self._drop_term(term)
+
+    def _matches(self, token):
+        """(term, weight) pairs for one query token: exact 3, prefix 2, fuzzy 1."""
+        found = {}
+        if token in self.postings:
+            found[token] = 3
+        i = bisect.bisect_left(self.vocabulary, token)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(token):
+            found.setdefault(self.vocabulary[i], 2)
+            i += 1
+        if len(token) >= 3:
+            grams = trigrams(token)
+            shared = defaultdict(int)
+            for gram in grams:
+                for term in self.grams.get(gram, ()):
+                    shared[term] += 1
+            for term, n in shared.items():
+                if term not in found and n / len(grams | trigrams(term)) >= 0.4:
+                    found[term] = 1
+        return found
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            scores = None
+            for token in tokens:
+                token_scores = {}
+                for term, weight in self._matches(token).items():
+                    for prod_id in self.postings[term]:
+                        if weight > token_scores.get(prod_id, 0):
+                            token_scores[prod_id] = weight
+                # every token has to match something (AND), the best match per token counts
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {p: s + token_scores[p] for p, s in scores.items() if p in token_scores}
+                if not scores:
+                    return []
+        return [p for _, p in heapq.nlargest(limit, ((s, p) for p, s in scores.items()))]
+# ************************************** IN-PROCESS INDEX **************************************
+
+
+# ************************************** PRODUCT SEARCH **************************************
+def _document(product):
+    return f'{product.prod_name or ""} {product.category.cat_name if product.category else ""}'
+
+
+class ProductSearch(object):
+    """Product search by name and category, with prefix and typo-tolerant matching.
+
+    On PostgreSQL queries run against the tsvector and pg_trgm indexes on product names, with
+    category words resolved to cat_ids first (category_list is cached) so that part of a query is
+    a lookup on the cat_id index rather than a join. Elsewhere each process keeps an
+    InvertedIndex: built on first search, updated straight away by the admin views of this
+    process and caught up every SEARCH_REFRESH_INTERVAL seconds with the products other
+    workers changed (Product.updated is indexed for that). Deletes leave no updated row
+    behind, so the refresh also compares the product count with the index and, when the
+    index holds more, drops the ids that are gone.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._index = None
+        self._watermark = None
+        self._checked = 0
+        self._build_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = app.config['SEARCH_BACKEND']
+        self.limit = app.config['SEARCH_LIMIT']
+        self.refresh_interval = app.config['SEARCH_REFRESH_INTERVAL']
+        app.extensions['product_search'] = self
+
+    @property
+    def uses_postgres(self):
+        if self.backend == 'auto':
+            return db.engine.dialect.name == 'postgresql'
+        return self.backend == 'postgres'
+
+    # ---- in-process index ------------------------------------------------------------------
+    def _load(self, query):
+        newest = self._watermark
+        for product in db.session.execute(query).scalars():
+            self._index.add(product.prod_id, _document(product))
+            if product.updated and (newest is None or product.updated > newest):
+                newest = product.updated
+        self._watermark = newest
+
+    def _ensure_index(self):
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    self._index = InvertedIndex()
+                    self._load(select(Product).execution_options(yield_per=2000))
+                    self._checked = time.monotonic()
+        elif time.monotonic() - self._checked >= self.refresh_interval:
+            self._checked = time.monotonic()
+            if self._watermark is not None:
+                self._load(select(Product).where(Product.updated >= self._watermark))
+            self._drop_deleted()
+        return self._index
+
+    def _drop_deleted(self):
+        # every product is indexed once caught up, so more documents than products means deletes
+        index = self._index
+        if len(index.docs) <= db.session.execute(select(func.count(Product.prod_id))).scalar():
+            return
+        existing = set(db.session.execute(select(Product.prod_id)).scalars())
+        for prod_id in [p for p in list(index.docs) if p not in existing]:
+            index.remove(prod_id)
+
+    def index_product(self, product):
+        if self._index is not None:
+            self._index.add(product.prod_id, _document(product))
+
+    def remove_product(self, prod_id):
+        if self._index is not None:
+            self._index.remove(prod_id)
+
+    # ---- queries ---------------------------------------------------------------------------
+    def _postgres_ids(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        name = func.to_tsvector('simple', Product.prod_name)
+        categories = [(c.cat_id, tokenize(c.cat_name)) for c in category_list()]
+        # every token must prefix a word of the name or of the product's category
+        matches = []
+        for token in tokens:
+            match = name.op('@@')(func.to_tsquery('simple', f'{token}:*'))
+            cat_ids = [cat_id for cat_id, words in categories if any(w.startswith(token) for w in words)]
+            matches.append(or_(match, Product.cat_id.in_(cat_ids)) if cat_ids else match)
+
+        text = ' '.join(tokens)
+        any_token = func.to_tsquery('simple', ' | '.join(f'{t}:*' for t in tokens))
+        similarity = func.similarity(func.lower(Product.prod_name), text)
+        return db.session.execute(
+            select(Product.prod_id)
+            .where(or_(and_(*matches), func.lower(Product.prod_name).op('%')(text)))
+            .order_by(desc(func.ts_rank(name, any_token) + similarity), Product.prod_id)
+            .limit(limit)
+        ).scalars().all()
+
+    def search_ids(self, query, limit=None):
+        limit = limit or self.limit
+        if self.uses_postgres:
+            return self._postgres_ids(query, limit)
+        return self._ensure_index().search(query, limit)
+
+    def search(self, query, limit=None):
+        """Matching products, best first; products deleted since indexing simply drop out.
+
+        When some of the ids found are gone, more are fetched so a full page still comes back.
+        """
+        limit = limit or self.limit
+        snapshot = current_snapshot()
+        fetch = limit
+        while True:
+            ids = self.search_ids(query, fetch)
+            products = snapshot.by_id(ids) if snapshot is not None else products_by_id(ids)
+            if len(products) >= limit or len(ids) < fetch or fetch >= limit * 16:
+                return products[:limit]
+            fetch *= 2
+# ************************************** PRODUCT SEARCH **************************************
@@ -0,0 +1,260 @@
+import json, mmap, os, struct, threading, time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+
+from pkg.models import db, Category, Product
+from pkg.readmodels import ProductView, product_rows, product_views
+
+
+# ************************************** CATALOG SNAPSHOT **************************************
+# With CATALOG_SNAPSHOT on, the storefront (catalog pages, category facets, search results)
+# reads products from one binary file per host instead of the database. Every gunicorn worker
+# maps the same file read-only, so the catalog sits once in the page cache however many workers
+# there are, and a page decodes only the rows it shows.
+#
+# Layout (little endian, every section 8-byte aligned):
+#   header      magic, format, version (time_ns of the build), counts and section offsets
+#   order       one (dateadded µs, prod_id, offset, length) record per product, newest first
+#   by_id       (prod_id, order position) pairs sorted by prod_id, for search results
+#   categories  JSON list of [cat_id, cat_name, product_count, list offset, list length]
+#   lists       per category, the order positions of its products (uint32, ascending)
+#   data        one compact JSON array per product (ProductView fields and images)
+#
+# Admin changes and stock changes ask for a rebuild; a background thread coalesces requests
+# for CATALOG_SNAPSHOT_DEBOUNCE seconds, writes the new file next to the old one and renames it
+# over it. Readers stat the path on each use and remap when it is a different file, so a
+# worker keeps serving the previous version until the new one is complete.
+
+MAGIC = b'IFCS'
+FORMAT = 1
+HEADER = struct.Struct('<4sHHQIIQQQQQ')
+ORDER = struct.Struct('<qIII')
+BY_ID = struct.Struct('<II')
+EPOCH = datetime(1970, 1, 1)
+
+SnapshotRow = namedtuple('SnapshotRow', 'prod_id prod_name amount status quantity cat_id dateadded '
+                                        'cat_name images')
+FacetRow = namedtuple('FacetRow', 'cat_id cat_name product_count')
+
+
+def _micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1) if dt else -2 ** 63
+
+
+def _pad(buf):
+    buf.extend(b'\0' * (-len(buf) % 8))
+    return len(buf)
+
+
+def write_snapshot(path, products, categories):
+    """Write `products` (ProductViews, newest first) and facet rows to `path` atomically."""
+    data = bytearray()
+    order = bytearray()
+    positions = {}
+    for i, p in enumerate(products):
+        payload = json.dumps([p.prod_id, p.prod_name, p.amount, p.status, p.quantity, p.cat_id,
+                              p.dateadded.isoformat() if p.dateadded else None,
+                              p.category.cat_name if p.category else None,
+                              [[img.img_id, img.filename, img.variants] for img in p.images]],
+                             separators=(',', ':')).encode()
+        order += ORDER.pack(_micros(p.dateadded), p.prod_id, len(data), len(payload))
+        data += payload
+        positions.setdefault(p.cat_id, []).append(i)
+
+    by_id = b''.join(BY_ID.pack(p.prod_id, i) for i, p in sorted(
+        ((i, p) for i, p in enumerate(products)), key=lambda item: item[1].prod_id))
+
+    lists = bytearray()
+    cats = []
+    for c in categories:
+        members = positions.get(c.cat_id, [])
+        cats.append([c.cat_id, c.cat_name, c.product_count, len(lists), len(members)])
+        lists += struct.pack(f'<{len(members)}I', *members)
+    cats = json.dumps(cats, separators=(',', ':')).encode()
+
+    body = bytearray(b'\0' * HEADER.size)
+    offsets = []
+    for section in (order, by_id, cats, lists, data):
+        offsets.append(_pad(body))
+        body += section
+    version = time.time_ns()
+    HEADER.pack_into(body, 0, MAGIC, FORMAT, 0, version, len(products), len(cats), *offsets)
+
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return version
+
+
+class MappedSnapshot(object):
+    """One snapshot file mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, fmt, _, self.version, self.count, cats_len,
+         self.order_at, self.by_id_at, cats_at, self.lists_at, self.data_at) = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        categories = json.loads(self.buf[cats_at:cats_at + cats_len])
+        self.categories = [FacetRow(cat_id, name, count) for cat_id, name, count, _, _ in categories]
+        self.lists = {cat_id: (offset, length) for cat_id, _, _, offset, length in categories}
+
+    def _record(self, i):
+        return ORDER.unpack_from(self.buf, self.order_at + i * ORDER.size)
+
+    def product(self, i):
+        _, _, offset, length = self._record(i)
+        start = self.data_at + offset
+        values = json.loads(self.buf[start:start + length])
+        values[6] = datetime.fromisoformat(values[6]) if values[6] else None
+        values[8] = [{'img_id': i, 'filename': f, 'variants': v} for i, f, v in values[8]]
+        return ProductView(SnapshotRow(*values))
+
+    def _after(self, dateadded, prod_id):
+        # first position whose (dateadded, prod_id) sorts below the cursor, newest first
+        key = (_micros(dateadded), prod_id)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[:2] < key:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def page(self, after, limit, cat_id=None):
+        """Up to `limit` products after the (dateadded, prod_id) cursor, newest first."""
+        start = self._after(*after) if after else 0
+        if cat_id is None:
+            members = range(start, min(start + limit, self.count))
+        else:
+            offset, length = self.lists.get(cat_id, (0, 0))
+            positions = memoryview(self.buf)[self.lists_at + offset:self.lists_at + offset + 4 * length].cast('I')
+            try:
+                first = bisect_left(positions, start)
+                members = positions[first:first + limit].tolist()
+            finally:
+                positions.release()
+        return [self.product(i) for i in members]
+
+    def by_id(self, ids):
+        found = []
+        for prod_id in ids:
+            lo, hi = 0, self.count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if BY_ID.unpack_from(self.buf, self.by_id_at + mid * BY_ID.size)[0] < prod_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < self.count:
+                key, position = BY_ID.unpack_from(self.buf, self.by_id_at + lo * BY_ID.size)
+                if key == prod_id:
+                    found.append(self.product(position))
+        return found
+
+
+def current_snapshot():
+    """The app's mapped snapshot, or None when storefront reads should go to the database."""
+    snapshot = current_app.extensions.get('catalog_snapshot')
+    return snapshot.current() if snapshot is not None else None
+
+
+class CatalogSnapshot(object):
+    """Builds the catalog snapshot file and serves storefront reads from it.
+
+    Off unless CATALOG_SNAPSHOT is set; catalog_page, category_facets and products_by_id fall
+    back to the database whenever current() returns None (off, or no file built yet). Build
+    one with `flask build-catalog-snapshot` or let the first admin change do it.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._mapped = None
+        self._load_lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['CATALOG_SNAPSHOT']
+        self.path = app.config['CATALOG_SNAPSHOT_PATH'] or os.path.join(app.instance_path, 'catalog.snapshot')
+        self.debounce = app.config['CATALOG_SNAPSHOT_DEBOUNCE']
+        app.extensions['catalog_snapshot'] = self
+
+    # ---- reading ---------------------------------------------------------------------------
+    def current(self):
+        """The mapped snapshot, remapped if the file was replaced; None when there is none."""
+        if not self.enabled:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.refresh()
+            return None
+        mapped = self._mapped
+        if mapped is None or (stat.st_ino, stat.st_mtime_ns) != (mapped.stat.st_ino, mapped.stat.st_mtime_ns):
+            with self._load_lock:
+                mapped = self._mapped
+                if mapped is None or (stat.st_ino, stat.st_mtime_ns) != (mapped.stat.st_ino, mapped.stat.st_mtime_ns):
+                    # the previous map is unmapped once the last request using it lets go
+                    mapped = self._mapped = MappedSnapshot(self.path)
+        return mapped
+
+    # ---- building --------------------------------------------------------------------------
+    def build(self):
+        """Write a snapshot of the current catalog. Returns (version, products)."""
+        products = product_views(product_rows().order_by(Product.dateadded.desc(), Product.prod_id.desc()))
+        categories = db.session.execute(
+            select(Category.cat_id, Category.cat_name, Category.product_count).order_by(Category.cat_name)).all()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        return write_snapshot(self.path, products, categories), len(products)
+
+    def refresh(self, prod_ids=()):
+        """Ask for a rebuild; product fragments in prod_ids are dropped once it is written."""
+        if not self.enabled:
+            return
+        with self._pending_lock:
+            self._pending.update(prod_ids)
+        self._wanted.set()
+        if self._thread is None or not self._thread.is_alive():
+            with self._pending_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='catalog-snapshot', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        from pkg import fragment_cache
+
+        with self.app.app_context():
+            while True:
+                self._wanted.wait()
+                time.sleep(self.debounce)  # let a burst of changes land in one build
+                self._wanted.clear()
+                with self._pending_lock:
+                    prod_ids, self._pending = self._pending, set()
+                try:
+                    self.build()
+                except Exception as e:
+                    self.app.logger.error("Building the catalog snapshot failed: %s", e, exc_info=True)
+                    continue
+                finally:
+                    db.session.remove()
+                # cards rendered from the old snapshot in the meantime are re-rendered
+                for prod_id in prod_ids:
+                    fragment_cache.invalidate(prod_id)
+# ************************************** CATALOG SNAPSHOT **************************************
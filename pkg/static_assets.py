@@ -0,0 +1,141 @@
+import gzip, hashlib, json, mimetypes, os, re
+
+from flask import abort, request, send_from_directory, url_for
+
+from pkg.images import IMMUTABLE_MAX_AGE
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    try:
+        import brotlicffi as brotli  # type: ignore
+    except ImportError:
+        brotli = None
+
+
+# ************************************** ASSET PIPELINE **************************************
+# The site's own CSS and JS live as plain files in pkg/assets/. `flask build-assets` minifies
+# each one into pkg/static/dist/ under a content-hashed name (home.3f9c2a1b7e.css) with .gz
+# and .br copies next to it, and records the names in manifest.json. Templates link them
+# through asset_url(), so a changed file gets a new URL and every URL can be cached forever.
+# Before a build (or with ASSETS_DEBUG) asset_url() points at the source files instead.
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    # deliberately conservative without a JS parser: line breaks stay, so semicolon
+    # insertion is untouched; only indentation, blank lines and whole-line comments go
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{10}\.(css|js)$')
+
+
+def _write(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetPipeline(object):
+    """Builds fingerprinted, precompressed assets and serves them with immutable caching."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._manifest = {}
+        self._manifest_mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.source_dir = os.path.join(app.root_path, 'assets')
+        self.dist_dir = app.config['ASSETS_DIST'] or os.path.join(app.static_folder, 'dist')
+        self.debug = app.config['ASSETS_DEBUG']
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+        app.extensions['asset_pipeline'] = self
+
+    # ---- build -----------------------------------------------------------------------------
+    def build(self):
+        """Minify, fingerprint and compress every source asset. Returns the manifest."""
+        manifest = {}
+        for root, _, files in os.walk(self.source_dir):
+            for name in sorted(files):
+                stem, ext = os.path.splitext(name)
+                if ext not in MINIFIERS:
+                    continue
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, self.source_dir).replace(os.sep, '/')
+                with open(source, encoding='utf-8') as f:
+                    data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+                digest = hashlib.sha256(data).hexdigest()[:10]
+                hashed = f'{os.path.dirname(logical)}/{stem}.{digest}{ext}'.lstrip('/')
+                target = os.path.join(self.dist_dir, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # files of earlier builds stay, for pages rendered before the deploy
+                if not os.path.exists(target):
+                    _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        _write(target + '.br', brotli.compress(data))
+                    _write(target, data)
+                manifest[logical] = hashed
+
+        os.makedirs(self.dist_dir, exist_ok=True)
+        _write(os.path.join(self.dist_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+        return manifest
+
+    # ---- lookup ----------------------------------------------------------------------------
+    def manifest(self):
+        # re-read when a build replaces the file, so running processes pick up new names
+        path = os.path.join(self.dist_dir, 'manifest.json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._manifest_mtime:
+            with open(path, encoding='utf-8') as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def url(self, name):
+        """URL of a source asset ('css/home.css'): its built copy if there is one."""
+        hashed = None if self.debug else self.manifest().get(name)
+        return url_for('asset', filename=hashed or name)
+
+    # ---- serving ---------------------------------------------------------------------------
+    def serve(self, filename):
+        built = os.path.join(self.dist_dir, filename)
+        if FINGERPRINTED.search(filename) and os.path.isfile(built):
+            mimetype = mimetypes.guess_type(filename)[0]
+            encoding = None
+            for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if request.accept_encodings[candidate] and os.path.isfile(built + suffix):
+                    encoding = candidate
+                    filename += suffix
+                    break
+            response = send_from_directory(self.dist_dir, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+            response.vary.add('Accept-Encoding')
+            return response
+
+        if not os.path.isfile(os.path.join(self.source_dir, filename)):
+            abort(404)
+        # unbuilt source: the URL does not change with the content, so it must be revalidated
+        response = send_from_directory(self.source_dir, filename, max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+# ************************************** ASSET PIPELINE **************************************
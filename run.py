@@ -1,4 +1,5 @@
 from pkg import app
 
+# development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Count database round-trips and commits for placing one order.
+
+Compares the old per-line commit loop of insert_order with pkg.orders.place_order.
+
+Usage: python scripts/bench_insert_order.py [cart_lines]
+"""
+import os, sys, tempfile, time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import event
+
+from pkg import app
+from pkg.models import db, Users, Product, Carts, History, Orders, OrderDetails, Payment
+from pkg.orders import place_order
+
+
+class Counter(object):
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+
+    def on_execute(self, *args):
+        self.statements += 1
+
+    def on_commit(self, *args):
+        self.commits += 1
+
+
+def seed(lines):
+    user = Users(fname='Bench', lname='User', username='bench', email=f'bench{time.time()}@ifarm.test',
+                 phone='08000000000', pwd='x')
+    db.session.add(user)
+    db.session.flush()
+    carts = []
+    for i in range(lines):
+        product = Product(prod_name=f'Bench {i}', amount=100 + i, status='in stock', quantity=100)
+        db.session.add(product)
+        db.session.flush()
+        carts.append(Carts(cart_prod_id=product.prod_id, cart_user_id=user.user_id,
+                           cart_qty=2, cart_amt=Decimal(100 + i)))
+    db.session.add_all(carts)
+    db.session.commit()
+    return user.user_id, [c.cart_id for c in carts]
+
+
+def legacy_insert_order(user_id, cart_ids):
+    # the pre-refactor insert_order body, minus the request/session plumbing
+    history = None
+    for cart_id in cart_ids:
+        cart = Carts.query.filter_by(cart_id=cart_id, cart_user_id=user_id).first()
+        payable = Decimal(cart.cart_amt) * cart.cart_qty
+        cart.cart_payable = payable
+        db.session.commit()
+        history = History(prod_id=cart.cart_prod_id, user_id=user_id, price=cart.cart_amt,
+                          quantity=cart.cart_qty, amt_payable=payable)
+        db.session.add(history)
+        db.session.commit()
+
+    order = Orders(order_status='0', order_userid=user_id)
+    db.session.add(order)
+    db.session.commit()
+
+    total = 0
+    for i in Carts.query.filter_by(cart_user_id=user_id).all():
+        total = total + i.cart_payable
+        db.session.add(OrderDetails(details_prod_id=i.cart_prod_id, details_orderid=order.order_id))
+        db.session.commit()
+
+    order.order_total = total
+    db.session.commit()
+    history.total = total
+    db.session.commit()
+
+    db.session.add(Payment(pay_user=user_id, pay_order=order.order_id, pay_amt=total, pay_ref='1'))
+    db.session.commit()
+
+
+def measure(fn, lines):
+    user_id, cart_ids = seed(lines)
+    db.session.expire_all()
+
+    counter = Counter()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter.on_execute)
+    event.listen(engine, 'commit', counter.on_commit)
+    started = time.perf_counter()
+    try:
+        fn(user_id, cart_ids)
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(engine, 'before_cursor_execute', counter.on_execute)
+        event.remove(engine, 'commit', counter.on_commit)
+    return counter, elapsed
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with app.app_context():
+        db.create_all()
+        for name, fn in (('legacy loop', legacy_insert_order), ('place_order', place_order)):
+            counter, elapsed = measure(fn, lines)
+            print(f"{name:<12} lines={lines:<4} statements={counter.statements:<5} "
+                  f"commits={counter.commits:<4} time={elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
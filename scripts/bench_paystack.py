@@ -0,0 +1,60 @@
+"""Compare one-off requests calls with the pooled PaystackClient against the fake gateway.
+
+Usage: python scripts/bench_paystack.py [calls] [threads]
+"""
+import os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from fake_paystack import serve
+from pkg.paystack import PaystackClient, PaystackError
+
+
+def run(label, fn, calls, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(fn, range(calls)))
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for r in results if r)
+    print(f"{label:<16} calls={calls:<5} ok={ok:<5} {calls / elapsed:8.1f} req/s")
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    server = serve(port=0, latency=0.002, fail_rate=0.05)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    client = PaystackClient()
+    client.base_url = base_url
+    client.secret_key = 'sk_test_bench'
+    client.backoff = 0.01
+    client.pool_size = threads
+    for i in range(calls):
+        client.initialize(f'bench{i}', 100, 'bench@ifarm.test', 'http://localhost/')
+
+    def one_off(i):
+        # the old paystack_update: a fresh connection and no timeout or retry
+        r = requests.get(f'{base_url}/transaction/verify/bench{i}',
+                         headers={'Authorization': 'Bearer sk_test_bench'})
+        return r.status_code == 200
+
+    def pooled(i):
+        try:
+            return client.verify(f'bench{i}').get('status') is True
+        except PaystackError:
+            return False
+
+    run('requests.get', one_off, calls, threads)
+    run('PaystackClient', pooled, calls, threads)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
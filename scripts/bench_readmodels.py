@@ -0,0 +1,87 @@
+"""Compare loading the product list as ORM entities and as read-model views.
+
+Seeds a throwaway SQLite database with products (two images each) and, for each size, times
+listing every product both ways and records the peak Python memory of each with tracemalloc.
+The ORM mode is what the admin product tables did before pkg.readmodels: Product entities
+with their images selectin-loaded and the category joined in.
+
+Usage: python scripts/bench_readmodels.py [products ...]     (default: 10000 100000)
+"""
+import gc, os, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import selectinload
+
+from pkg import app
+from pkg.models import db, Category, Image, Product
+from pkg.readmodels import product_views
+
+
+def seed(total):
+    """Top the product table up to `total` rows."""
+    have = db.session.execute(select(func.count(Product.prod_id))).scalar()
+    if not db.session.execute(select(Category.cat_id)).first():
+        db.session.add_all([Category(cat_name=f'Bench category {i}') for i in range(10)])
+        db.session.flush()
+    for start in range(have, total, 5000):
+        count = min(5000, total - start)
+        db.session.execute(insert(Product), [
+            {'prod_name': f'Bench product {i}', 'amount': 100 + i % 900, 'status': 'in stock',
+             'quantity': 50, 'cat_id': 1 + i % 10} for i in range(start, start + count)])
+        ids = db.session.execute(select(Product.prod_id).order_by(Product.prod_id.desc()).limit(count)).scalars()
+        db.session.execute(insert(Image), [
+            {'filename': f'{prod_id}-{n}.jpg', 'product_id': prod_id,
+             'variants': '{"thumb": {"w": 160, "h": 120, "files": {"jpg": "thumb.jpg"}}}'}
+            for prod_id in ids for n in (1, 2)])
+    db.session.commit()
+
+
+def orm_products():
+    products = Product.query.options(selectinload(Product.images)).all()
+    # what the templates touch
+    for p in products:
+        p.prod_name, p.amount, p.category.cat_name, [i.filename for i in p.images]
+    return products
+
+
+def view_products():
+    products = product_views()
+    for p in products:
+        p.prod_name, p.amount, p.category.cat_name, [i.filename for i in p.images]
+    return products
+
+
+def measure(fn):
+    db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        products = fn()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del products
+    db.session.remove()
+    return elapsed, peak
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000]
+    with app.app_context():
+        db.create_all()
+        for total in sorted(sizes):
+            seed(total)
+            results = {name: measure(fn) for name, fn in (('orm', orm_products), ('views', view_products))}
+            for name, (elapsed, peak) in results.items():
+                print(f"{name:<6} products={total:<7} time={elapsed * 1000:8.1f}ms  peak={peak / 2 ** 20:7.1f}MiB")
+            (orm_time, orm_peak), (view_time, view_peak) = results['orm'], results['views']
+            print(f"       views: {orm_time / view_time:.1f}x faster, {orm_peak / view_peak:.1f}x less memory")
+
+
+if __name__ == '__main__':
+    main()
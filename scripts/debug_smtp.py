@@ -0,0 +1,89 @@
+"""A local SMTP server that prints every message it receives instead of delivering it.
+
+Stands in for a real mail server while developing: point the app at it with
+MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0 and run `flask send-mail`. Recipients
+containing --reject are refused with a 550, to watch the outbox retry and give up.
+
+Usage: python scripts/debug_smtp.py [--port 1025] [--reject text]
+"""
+import argparse, socketserver, sys
+from email import message_from_bytes, policy
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost debug SMTP ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command[8:].strip()
+                if self.server.reject and self.server.reject in address:
+                    self.reply('550 Mailbox unavailable')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw[1:] if raw.startswith(b'..') else raw)
+                self.show(sender, recipients, b''.join(data))
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def show(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=policy.default)
+        body = message.get_body(('plain', 'html'))
+        print(f"---------- from {sender} to {', '.join(recipients)}")
+        print(f"Subject: {message['subject']}")
+        print(body.get_content() if body is not None else '')
+        sys.stdout.flush()
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--reject', help='refuse recipients containing this text')
+    args = parser.parse_args()
+
+    with SMTPServer(('127.0.0.1', args.port), SMTPHandler) as server:
+        server.reject = args.reject
+        print(f'Debug SMTP server on 127.0.0.1:{args.port}, Ctrl+C to stop.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
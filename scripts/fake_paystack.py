@@ -0,0 +1,99 @@
+"""A local stand-in for the parts of the Paystack API the app uses.
+
+    python scripts/fake_paystack.py --port 8765 --latency 0.05 --fail-rate 0.1
+
+then run the app with PAYSTACK_BASE_URL=http://127.0.0.1:8765.
+
+Every initialized transaction verifies as 'Successful' unless its reference ends in 'F'.
+--fail-rate answers that share of requests with a 503 to exercise the client's retries.
+"""
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, like the real gateway
+    disable_nagle_algorithm = True
+
+    transactions = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _misbehave(self):
+        time.sleep(self.server.latency)
+        if random.random() < self.server.fail_rate:
+            self._reply(503, {'status': False, 'message': 'Service unavailable'})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length) or b'{}')
+        if self._misbehave():
+            return
+        if self.path != '/transaction/initialize':
+            return self._reply(404, {'status': False, 'message': 'Not found'})
+
+        ref = str(data.get('reference'))
+        with self.lock:
+            if ref in self.transactions:
+                return self._reply(400, {'status': False, 'message': 'Duplicate Transaction Reference'})
+            self.transactions[ref] = data
+
+        host = self.headers.get('Host', 'localhost')
+        self._reply(200, {'status': True, 'message': 'Authorization URL created',
+                          'data': {'authorization_url': f'http://{host}/checkout/{ref}',
+                                   'access_code': ref, 'reference': ref}})
+
+    def do_GET(self):
+        if self._misbehave():
+            return
+        if not self.path.startswith('/transaction/verify/'):
+            return self._reply(404, {'status': False, 'message': 'Not found'})
+
+        ref = self.path.rsplit('/', 1)[-1]
+        with self.lock:
+            data = self.transactions.get(ref)
+        if data is None:
+            return self._reply(400, {'status': False, 'message': 'Transaction reference not found'})
+
+        gateway_response = 'Declined' if ref.endswith('F') else 'Successful'
+        self._reply(200, {'status': True, 'message': 'Verification successful',
+                          'data': {'reference': ref, 'amount': data.get('amount'),
+                                   'status': 'success' if gateway_response == 'Successful' else 'failed',
+                                   'gateway_response': gateway_response}})
+
+
+def serve(port=8765, latency=0.0, fail_rate=0.0):
+    """Start the fake gateway in a background thread and return the server."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakePaystackHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every reply')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.fail_rate)
+    print(f'Fake Paystack listening on http://127.0.0.1:{args.port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
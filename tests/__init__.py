@@ -0,0 +1,34 @@
+"""Test suite: python -m unittest discover -s tests -t .
+
+The environment is set here, before pkg (and its config) is first imported: a throwaway
+SQLite database and no background threads or worker pools.
+"""
+import os, tempfile, unittest
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['CATALOG_CACHE_PATH'] = os.path.join(_tmp, 'catalog_cache.db')
+os.environ['IMAGE_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['PAYMENT_WORKER_INPROCESS'] = '0'
+os.environ['MAIL_OUTBOX_INPROCESS'] = '0'
+os.environ['CATALOG_SNAPSHOT'] = '0'
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test in an app context on freshly created tables."""
+
+    def setUp(self):
+        from pkg import app
+        from pkg.models import db
+
+        self.app = app
+        self.db = db
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.drop_all()
+        self.context.pop()
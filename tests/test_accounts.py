@@ -0,0 +1,45 @@
+from pkg.accounts import classify_identifier, find_account
+from pkg.models import db, Users
+from tests import DatabaseTestCase
+
+
+class FindAccountTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([
+            Users(fname='Ada', lname='Obi', username='ada', email='Ada@Example.com',
+                  phone='08031112222', pwd='x'),
+            Users(fname='Ben', lname='Eze', username='2348099990000', email='ben@example.com',
+                  phone='08054443333', pwd='x'),
+        ])
+        db.session.commit()
+
+    def test_email_phone_and_username(self):
+        self.assertEqual(find_account(Users, 'ada@example.COM').username, 'ada')
+        self.assertEqual(find_account(Users, '+234 803-111-2222').username, 'ada')
+        self.assertEqual(find_account(Users, 'ada').username, 'ada')
+        self.assertIsNone(find_account(Users, 'nobody'))
+
+    def test_digit_username_falls_back_from_phone(self):
+        self.assertEqual(classify_identifier('2348099990000'), ('phone', '08099990000'))
+        self.assertEqual(find_account(Users, '2348099990000').email, 'ben@example.com')
+        self.assertIsNone(find_account(Users, '08099990000'))
+
+    def test_changes_are_seen_by_the_next_login(self):
+        self.assertEqual(find_account(Users, 'ada').email, 'Ada@Example.com')
+        ada = find_account(Users, 'ada')
+        ada.username = 'ada_obi'
+        db.session.commit()
+        self.assertIsNone(find_account(Users, 'ada'))
+        self.assertEqual(find_account(Users, 'ada_obi').user_id, ada.user_id)
+
+        db.session.delete(ada)
+        db.session.commit()
+        self.assertIsNone(find_account(Users, 'ada@example.com'))
+
+    def test_shared_phone_resolves_to_the_oldest_account(self):
+        db.session.add(Users(fname='Ada', lname='Two', username='ada2', email='ada2@example.com',
+                             phone='08031112222', pwd='x'))
+        db.session.commit()
+        self.assertEqual(find_account(Users, '08031112222').username, 'ada')
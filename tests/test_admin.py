@@ -0,0 +1,48 @@
+from io import BytesIO
+from unittest import mock
+
+from pkg import image_pipeline
+from pkg.models import db, Image, Product
+from tests import DatabaseTestCase
+
+
+class UpdateProductTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        product = Product(prod_name='Yam', amount=1250, status='in stock', quantity=5)
+        db.session.add(product)
+        db.session.commit()
+        self.product = product.prod_id
+
+        csrf = mock.patch.dict(self.app.config, {'WTF_CSRF_ENABLED': False})
+        csrf.start()
+        self.addCleanup(csrf.stop)
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['adminonline'] = 1
+
+    def update(self, id):
+        data = {'id': id, 'price': '1500', 'status': 'in stock',
+                'image': (BytesIO(b'\xff\xd8\xff'), 'yam.jpg')}
+        with mock.patch.object(image_pipeline, 'save', return_value='yam.jpg') as save, \
+                mock.patch.object(image_pipeline, 'submit'):
+            response = self.client.post('/admin/update/product/', data=data,
+                                        content_type='multipart/form-data')
+        return response, save
+
+    def test_missing_product_saves_no_images(self):
+        for id in (str(self.product + 1), 'abc', ''):
+            response, save = self.update(id)
+            self.assertEqual(response.status_code, 302)
+            save.assert_not_called()
+        self.assertEqual(Image.query.count(), 0)
+        with self.client.session_transaction() as sess:
+            self.assertIn(('danger', 'Product not found!'), sess['_flashes'])
+
+    def test_images_are_attached_to_the_product(self):
+        response, save = self.update(str(self.product))
+        self.assertEqual(response.status_code, 302)
+        save.assert_called_once()
+        self.assertEqual([i.product_id for i in Image.query.all()], [self.product])
+        self.assertEqual(db.session.get(Product, self.product).amount, 1500)
@@ -0,0 +1,34 @@
+import os, tempfile, unittest
+
+from flask import Flask
+
+from pkg.cache import FragmentCache, MemoryCache
+
+
+class FragmentVersionTestCase(unittest.TestCase):
+
+    def worker(self, backend):
+        # each FragmentCache stands in for one gunicorn worker on the same host
+        app = Flask(__name__)
+        app.config.update(CATALOG_CACHE_BACKEND=backend,
+                          CATALOG_CACHE_PATH=os.path.join(self.tmp.name, 'catalog_cache.db'))
+        return FragmentCache(app)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_memory_backend_shares_versions_between_workers(self):
+        first, second = self.worker('memory'), self.worker('memory')
+        self.assertIsInstance(first.backend, MemoryCache)
+        before = second._key('card.html', 7, 'out')
+
+        first.invalidate(7)
+
+        self.assertNotEqual(second._key('card.html', 7, 'out'), before)
+        self.assertEqual(second._key('card.html', 8, 'out'), 'frag:card.html:8:v0:out')
+
+    def test_sqlite_backend_shares_versions_between_workers(self):
+        first, second = self.worker('sqlite'), self.worker('sqlite')
+        first.invalidate(7)
+        self.assertEqual(second._key('card.html', 7, 'in'), 'frag:card.html:7:v1:in')
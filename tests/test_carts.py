@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from pkg.carts import cart_lines, cart_summary, upsert_line
+from pkg.models import db, Payment, Product, Users
+from pkg.orders import place_order
+from tests import DatabaseTestCase
+
+
+class CartTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = Users(fname='Ada', lname='Obi', username='ada', email='ada@example.com',
+                     phone='08030000000', pwd='x')
+        product = Product(prod_name='Yam', amount=1250, status='in stock', quantity=5)
+        db.session.add_all([user, product])
+        db.session.commit()
+        self.user, self.product = user.user_id, product.prod_id
+
+
+class CartTotalTestCase(CartTestCase):
+
+    def test_totals_agree_after_a_price_change(self):
+        self.assertTrue(upsert_line(self.user, self.product, 2))
+        db.session.get(Product, self.product).amount = 1500
+        db.session.commit()
+
+        lines, total = cart_lines(self.user)
+        self.assertEqual(total, Decimal('3000.00'))
+        self.assertEqual(cart_summary(self.user)['total'], '3000.00')
+        self.assertEqual(Decimal(str(lines[0].line_total)), Decimal('3000'))
+
+        ref = place_order(self.user, [lines[0].cart_id])
+        self.assertEqual(Payment.query.filter_by(pay_ref=str(ref)).one().pay_amt, 3000)
+
+
+class UpsertLineTestCase(CartTestCase):
+
+    def quantity(self):
+        return cart_summary(self.user, self.product)['quantity']
+
+    def test_adds_count_what_is_already_in_the_cart(self):
+        self.assertTrue(upsert_line(self.user, self.product, 3))
+        self.assertFalse(upsert_line(self.user, self.product, 3))
+        self.assertEqual(self.quantity(), 3)
+        self.assertTrue(upsert_line(self.user, self.product, 2))
+        self.assertEqual(self.quantity(), 5)
+        self.assertFalse(upsert_line(self.user, self.product, 1))
+        self.assertEqual(self.quantity(), 5)
+
+    def test_setting_a_quantity_checks_only_that_quantity(self):
+        self.assertTrue(upsert_line(self.user, self.product, 4))
+        self.assertTrue(upsert_line(self.user, self.product, 5, add=False))
+        self.assertFalse(upsert_line(self.user, self.product, 6, add=False))
+        self.assertEqual(self.quantity(), 5)
+
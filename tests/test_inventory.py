@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from pkg.inventory import commit_orders, release_expired, reserve, short_orders
+from pkg.models import db, Orders, Product, StockReservation, Users
+from tests import DatabaseTestCase
+
+
+class ReservationTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = Users(fname='Ada', lname='Obi', username='ada', email='ada@example.com',
+                     phone='08030000000', pwd='x')
+        product = Product(prod_name='Yam', amount=1250, status='in stock', quantity=5)
+        db.session.add_all([user, product])
+        db.session.flush()
+        orders = [Orders(order_status='0', order_userid=user.user_id) for _ in range(2)]
+        db.session.add_all(orders)
+        db.session.commit()
+        self.user, self.product = user.user_id, product.prod_id
+        self.first, self.second = (o.order_id for o in orders)
+
+    def stock(self):
+        return db.session.execute(select(Product.quantity).where(Product.prod_id == self.product)).scalar()
+
+    def statuses(self):
+        return dict(db.session.execute(select(StockReservation.order_id, StockReservation.status)).all())
+
+    def expire(self, order_id):
+        db.session.execute(update(StockReservation).where(StockReservation.order_id == order_id)
+                           .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+
+    def test_a_new_checkout_keeps_earlier_unpaid_holds(self):
+        reserve(self.user, self.first, [(self.product, 2)])
+        reserve(self.user, self.second, [(self.product, 2)])
+        db.session.commit()
+        self.assertEqual(self.statuses(), {self.first: 'held', self.second: 'held'})
+        self.assertEqual(self.stock(), 1)
+
+    def test_a_new_checkout_gives_back_expired_holds(self):
+        reserve(self.user, self.first, [(self.product, 4)])
+        self.expire(self.first)
+        reserve(self.user, self.second, [(self.product, 3)])
+        db.session.commit()
+        self.assertEqual(self.statuses(), {self.first: 'released', self.second: 'held'})
+        self.assertEqual(self.stock(), 2)
+
+    def test_late_payment_without_stock_is_flagged(self):
+        reserve(self.user, self.first, [(self.product, 4)])
+        self.expire(self.first)
+        self.assertEqual(release_expired(), 1)
+        reserve(self.user, self.second, [(self.product, 5)])
+        db.session.commit()
+
+        commit_orders([self.first])
+        db.session.commit()
+        self.assertEqual(self.statuses()[self.first], 'short')
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual([(r.order_id, r.quantity, r.prod_name) for r in short_orders()],
+                         [(self.first, 4, 'Yam')])
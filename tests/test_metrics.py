@@ -0,0 +1,60 @@
+import json, os, subprocess, sys, tempfile, unittest
+
+from flask import Flask
+
+from pkg.metrics import Metrics
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+class WorkerFilesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def worker(self):
+        app = Flask(__name__)
+        app.config.update(METRICS_ENABLED=False, METRICS_DIR=self.directory,
+                          METRICS_FLUSH_INTERVAL=5, METRICS_TOKEN=None)
+        return Metrics(app)
+
+    def files(self):
+        return sorted(f for f in os.listdir(self.directory) if f.endswith('.json'))
+
+    def requests_total(self, metrics):
+        return metrics.collect()['counters'].get(('http_requests_total', ('endpoint', 'home')))
+
+    def test_retired_worker_is_folded_into_one_file(self):
+        gone = self.worker()
+        gone.inc('http_requests_total', 3, endpoint='home')
+        gone.add_gauge('http_requests_in_flight', 1)
+        gone.retire()
+        self.assertEqual(self.files(), ['exited.json'])
+
+        live = self.worker()
+        live.inc('http_requests_total', 2, endpoint='home')
+        self.assertEqual(self.requests_total(live), 5)
+        self.assertNotIn(('http_requests_in_flight',), live.collect()['gauges'])
+
+    def test_scrape_folds_files_of_killed_workers(self):
+        pid = dead_pid()
+        with open(os.path.join(self.directory, f'{pid}-1.json'), 'w') as out:
+            json.dump({'pid': pid, 'counters': [[['http_requests_total', ['endpoint', 'home']], 4]],
+                       'histograms': [], 'gauges': [[['http_requests_in_flight'], 1]]}, out)
+
+        live = self.worker()
+        self.assertEqual(self.requests_total(live), 4)
+        self.assertEqual(self.requests_total(live), 4)
+        self.assertEqual(self.files(), sorted(['exited.json', os.path.basename(live._file)]))
+
+    def test_label_values_are_escaped(self):
+        metrics = self.worker()
+        metrics.directory = None
+        metrics.inc('http_requests_total', endpoint='say "hi"\\\n')
+        self.assertIn('http_requests_total{endpoint="say \\"hi\\"\\\\\\n"} 1', metrics.render())
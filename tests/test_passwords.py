@@ -0,0 +1,23 @@
+import unittest
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from unittest import mock
+
+from pkg.passwords import HashingBusy, PasswordHasher
+
+
+class HasherTestCase(unittest.TestCase):
+
+    def test_timeout_is_reported_as_busy(self):
+        hasher = PasswordHasher()
+        hasher.workers = 1
+        future = mock.Mock(spec=Future)
+        future.result.side_effect = FutureTimeout()
+        pool = mock.Mock(submit=mock.Mock(return_value=future))
+        with mock.patch.object(PasswordHasher, 'pool', new=pool):
+            with self.assertRaises(HashingBusy) as raised:
+                hasher.verify('scrypt:32768:8:1$salt$hash', 'secret')
+        future.cancel.assert_called_once_with()
+        self.assertEqual(hasher.rejected, 1)
+        self.assertNotIn('sign-in', str(raised.exception))
+        # the slot was given back
+        self.assertTrue(hasher._slots.acquire(blocking=False))
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+from pkg.paystack import PaystackClient, PaystackError
+
+
+def reply(status, body=None):
+    response = mock.Mock(status_code=status)
+    response.json.return_value = body if body is not None else {'status': status < 400}
+    return response
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = PaystackClient()
+        self.client.max_retries = 2
+        self.request = mock.Mock()
+        session = mock.Mock(request=self.request)
+        patches = [mock.patch.object(PaystackClient, 'session', new=session),
+                   mock.patch('pkg.paystack.time.sleep'),
+                   mock.patch('pkg.paystack._record')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def initialize(self):
+        return self.client.initialize('REF-1', 2500, 'ada@example.com', 'https://example.com/back')
+
+    def test_verify_retries_server_errors(self):
+        self.request.side_effect = [reply(503), reply(429), reply(200, {'status': True})]
+        self.assertEqual(self.client.verify('REF-1'), {'status': True})
+        self.assertEqual(self.request.call_count, 3)
+
+    def test_verify_raises_when_the_outage_outlasts_the_retries(self):
+        self.request.side_effect = [reply(503, {'status': False}) for _ in range(3)]
+        with self.assertRaises(PaystackError):
+            self.client.verify('REF-1')
+        self.assertEqual(self.request.call_count, 3)
+
+    def test_initialize_does_not_retry_server_errors(self):
+        self.request.side_effect = [reply(502, {'status': False}), reply(200, {'status': True})]
+        with self.assertRaises(PaystackError):
+            self.initialize()
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_initialize_retries_when_it_could_not_connect(self):
+        refused = requests.ConnectionError(mock.Mock(reason=NewConnectionError(None, 'refused')))
+        self.request.side_effect = [refused, requests.ConnectTimeout(), reply(200, {'status': True})]
+        self.assertEqual(self.initialize(), {'status': True})
+        self.assertEqual(self.request.call_count, 3)
+
+    def test_initialize_does_not_retry_a_dropped_response(self):
+        self.request.side_effect = [requests.ConnectionError(ProtocolError('Connection aborted.')),
+                                    reply(200, {'status': True})]
+        with self.assertRaises(PaystackError):
+            self.initialize()
+        self.assertEqual(self.request.call_count, 1)
@@ -0,0 +1,166 @@
+import json, threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import func, select
+
+from pkg import reconciler
+from pkg.models import (db, History, OrderDetails, Orders, OutboxMessage, Payment, PaymentJob, Product,
+                        ProductSalesDaily, SalesDaily, StockReservation, UserSpend, Users)
+from pkg.paystack import PaystackClient
+from pkg.history import history_page
+from pkg.reconcile import outcome_from_event, settle
+from tests import DatabaseTestCase
+
+
+def charge(ref, status='success', amount=250000):
+    return {'event': 'charge.success', 'data': {'reference': ref, 'status': status, 'amount': amount}}
+
+
+class PaymentTestCase(DatabaseTestCase):
+    """A user with one pending order of two yams."""
+
+    def setUp(self):
+        super().setUp()
+        user = Users(fname='Ada', lname='Obi', username='ada', email='ada@example.com',
+                     phone='08030000000', pwd='x')
+        product = Product(prod_name='Yam', amount=1250, status='in stock', quantity=10)
+        db.session.add_all([user, product])
+        db.session.flush()
+        order = Orders(order_status='0', order_userid=user.user_id, order_total=2500)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([
+            OrderDetails(details_prod_id=product.prod_id, details_orderid=order.order_id),
+            History(prod_id=product.prod_id, user_id=user.user_id, price=1250, quantity=2,
+                    amt_payable=2500, total=2500, order_id=order.order_id),
+            Payment(pay_user=user.user_id, pay_order=order.order_id, pay_amt=2500, pay_ref='REF-1',
+                    pay_date=datetime.utcnow()),
+        ])
+        db.session.commit()
+        self.user, self.product, self.order = user.user_id, product.prod_id, order.order_id
+
+    def outcomes(self, status='success'):
+        payload = charge('REF-1', status)
+        return {'REF-1': (*outcome_from_event(payload), payload)}
+
+    def settle_ref(self, status='success'):
+        payments = Payment.query.filter(Payment.pay_ref == 'REF-1').all()
+        result = settle(payments, self.outcomes(status))
+        db.session.commit()
+        return result
+
+    def count(self, column):
+        return db.session.execute(select(func.count()).select_from(column.table)).scalar()
+
+
+class SettleTestCase(PaymentTestCase):
+
+    def test_settling_the_same_ref_twice_records_once(self):
+        self.assertEqual(self.settle_ref(), (1, 0))
+        self.assertEqual(self.settle_ref(), (0, 0))
+
+        self.assertEqual(db.session.get(Payment, 1).pay_status, 'paid')
+        self.assertEqual(self.count(OutboxMessage.msg_id), 1)
+        lifetime = db.session.get(UserSpend, (self.user, 'lifetime'))
+        self.assertEqual(lifetime.orders, 1)
+        self.assertEqual(db.session.execute(select(SalesDaily.paid)).scalar(), 1)
+        self.assertEqual(db.session.execute(select(ProductSalesDaily.units)).scalar(), 2)
+
+    def test_racing_workers_settle_once(self):
+        # this worker reads the payment as pending ...
+        stale = Payment.query.filter(Payment.pay_ref == 'REF-1').all()
+        self.assertEqual(stale[0].pay_status, 'pending')
+
+        # ... while another worker settles the same ref and commits first
+        def other_worker():
+            with self.app.app_context():
+                try:
+                    self.settle_ref()
+                finally:
+                    db.session.remove()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        worker.join()
+
+        self.assertEqual(settle(stale, self.outcomes()), (0, 0))
+        db.session.commit()
+        self.assertEqual(self.count(OutboxMessage.msg_id), 1)
+        self.assertEqual(db.session.get(UserSpend, (self.user, 'lifetime')).orders, 1)
+        self.assertEqual(db.session.execute(select(SalesDaily.paid)).scalar(), 1)
+        self.assertEqual(json.loads(db.session.get(Payment, 1).pay_data)['data']['reference'], 'REF-1')
+
+    def test_failed_then_paid_keeps_the_order_lines(self):
+        self.assertEqual(self.settle_ref('failed'), (0, 1))
+        # the lines stay, but the purchase history leaves the failed order out
+        self.assertEqual(self.count(History.id), 1)
+        self.assertEqual(history_page(self.user)[0], [])
+        self.assertEqual(db.session.execute(select(SalesDaily.failed)).scalar(), 1)
+
+        self.assertEqual(self.settle_ref('success'), (1, 0))
+        rows, _ = history_page(self.user)
+        self.assertEqual([(r.order_id, r.quantity) for r in rows], [(self.order, 2)])
+        daily = db.session.execute(select(SalesDaily)).scalar_one()
+        self.assertEqual((daily.paid, daily.failed, daily.units), (1, 0, 2))
+        self.assertEqual(db.session.execute(select(ProductSalesDaily.units)).scalar(), 2)
+        receipt = db.session.execute(select(OutboxMessage.body)).scalar_one()
+        self.assertIn('Yam', receipt)
+
+
+class GatewayAnswerTestCase(PaymentTestCase):
+    """Only a final answer from Paystack settles a payment; anything else is asked again."""
+
+    def setUp(self):
+        super().setUp()
+        db.session.add(StockReservation(prod_id=self.product, order_id=self.order, user_id=self.user,
+                                        quantity=2, expires_at=datetime.utcnow() + timedelta(minutes=30)))
+        db.session.add(PaymentJob(kind='verify', pay_ref='REF-1'))
+        db.session.commit()
+        for patch in (mock.patch('pkg.paystack.time.sleep'), mock.patch('pkg.paystack._record')):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_job(self, *responses):
+        request = mock.Mock(side_effect=list(responses))
+        with mock.patch.object(PaystackClient, 'session', new=mock.Mock(request=request)):
+            self.assertEqual(reconciler.run_once(), 1)
+        db.session.expire_all()
+        return db.session.get(Payment, 1), db.session.execute(select(PaymentJob)).scalar_one()
+
+    def assert_left_pending(self, pay, job):
+        self.assertEqual(pay.pay_status, 'pending')
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, datetime.utcnow())
+        self.assertEqual(db.session.execute(select(StockReservation.status)).scalar_one(), 'held')
+        self.assertEqual(db.session.execute(select(SalesDaily.failed)).scalar(), None)
+
+    def test_gateway_outage_requeues_the_job(self):
+        outage = mock.Mock(status_code=503)
+        outage.json.return_value = {'status': False, 'message': 'Service unavailable'}
+        pay, job = self.run_job(*[outage] * (reconciler.app.config['PAYSTACK_MAX_RETRIES'] + 1))
+        self.assert_left_pending(pay, job)
+        self.assertIn('503', job.last_error)
+
+    def test_ongoing_transaction_requeues_the_job(self):
+        ongoing = mock.Mock(status_code=200)
+        ongoing.json.return_value = {'status': True, 'data': {'reference': 'REF-1', 'status': 'ongoing',
+                                                              'amount': 250000}}
+        pay, job = self.run_job(ongoing)
+        self.assert_left_pending(pay, job)
+        self.assertIn('ongoing', job.last_error)
+
+    def test_abandoned_transaction_fails_the_payment(self):
+        abandoned = mock.Mock(status_code=200)
+        abandoned.json.return_value = {'status': True, 'data': {'reference': 'REF-1', 'status': 'abandoned',
+                                                                'amount': 250000}}
+        pay, job = self.run_job(abandoned)
+        self.assertEqual((pay.pay_status, job.status), ('failed', 'done'))
+        self.assertEqual(db.session.execute(select(StockReservation.status)).scalar_one(), 'released')
+
+    def test_only_final_answers_count(self):
+        self.assertEqual(outcome_from_event({'status': False, 'message': 'Server error'}), ('pending', 0))
+        self.assertEqual(outcome_from_event({'event': 'charge.dispute.create',
+                                             'data': {'status': 'ongoing'}}), ('pending', 0))
+        self.assertEqual(outcome_from_event({'event': 'charge.failed', 'data': {'amount': 100}})[0], 'failed')
+        self.assertEqual(outcome_from_event(charge('REF-1'))[0], 'paid')
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from sqlalchemy import delete
+
+from pkg import product_search
+from pkg.models import db, Product
+from tests import DatabaseTestCase
+
+
+class SearchJsonTestCase(DatabaseTestCase):
+
+    def limit_for(self, query_string):
+        with mock.patch.object(product_search, 'search', return_value=[]) as search:
+            response = self.app.test_client().get('/search/json/?q=yam' + query_string)
+        self.assertEqual(response.status_code, 200)
+        return search.call_args.kwargs['limit']
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.limit_for(''), 10)
+        self.assertEqual(self.limit_for('&limit=5'), 5)
+        self.assertEqual(self.limit_for('&limit=100000'), self.app.config['SEARCH_LIMIT'])
+        self.assertEqual(self.limit_for('&limit=0'), 1)
+        self.assertEqual(self.limit_for('&limit=-3'), 1)
+
+
+class InProcessIndexTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([Product(prod_name=f'Yam tuber {i}', amount=100, status='in stock', quantity=5)
+                            for i in range(6)])
+        db.session.commit()
+        for name, value in (('_index', None), ('_watermark', None), ('refresh_interval', 0)):
+            patch = mock.patch.object(product_search, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def delete_in_another_worker(self, *prod_ids):
+        # no remove_product() call in this process, just the rows going away
+        db.session.execute(delete(Product).where(Product.prod_id.in_(prod_ids)))
+        db.session.commit()
+
+    def test_refresh_drops_products_deleted_elsewhere(self):
+        self.assertEqual(len(product_search.search_ids('yam', 10)), 6)
+        self.delete_in_another_worker(2, 5)
+        self.assertEqual(sorted(product_search.search_ids('yam', 10)), [1, 3, 4, 6])
+
+    def test_results_are_refilled_when_found_products_are_gone(self):
+        product_search.search_ids('yam', 10)
+        product_search.refresh_interval = 3600  # the index has not caught up yet
+        self.delete_in_another_worker(*product_search.search_ids('yam', 3))
+        self.assertEqual(len(product_search.search('yam', limit=3)), 3)